@@ -1,14 +1,16 @@
 
 
-from core.hierarchical_rag_system import HierarchicalRAGSystem
-from core.law_rag_query_engine import LegalRAGQueryEngine
+from core.retrieval_server import RetrievalClient, ServerUnavailableError
 
 
 
 import sys
 
-def main():
-    """Example usage của RAG system"""
+def _load_local_system():
+    """Load model + DB trong process, trả về (search, answer_question)"""
+    
+    from core.hierarchical_rag_system import HierarchicalRAGSystem
+    from core.law_rag_query_engine import LegalRAGQueryEngine
     
     # Initialize system
     rag_system = HierarchicalRAGSystem(
@@ -30,6 +32,11 @@ def main():
     
     # Initialize query engine
     query_engine = LegalRAGQueryEngine(rag_system)
+    return rag_system.search, query_engine.answer_question
+
+
+def main():
+    """Example usage của RAG system"""
     
     # Check if query was passed as command-line argument
     if len(sys.argv) > 1:
@@ -37,10 +44,28 @@ def main():
     else:
         query = input("🔍 Enter your query: ")
     
+    # Dùng retrieval server nếu đang chạy, tránh load lại model và DB
+    client = RetrievalClient()
+    
     print(f"\n🔍 Query: {query}")
     
-    # Search
-    results = rag_system.search(query, top_k=3)
+    try:
+        results = client.search(query, top_k=3)
+        answer_question = client.build_context
+        print("Connected to retrieval server.")
+    except ServerUnavailableError:
+        results = None
+    except (OSError, RuntimeError) as e:
+        # Server đang chạy nhưng bận / lỗi: không load DB trong process thứ hai
+        print(f"❌ Retrieval server error: {e}")
+        return
+    
+    if results is None:
+        # Chỉ load model + DB khi không có server
+        search, answer_question = _load_local_system()
+        
+        # Search
+        results = search(query, top_k=3)
     
     for i, result in enumerate(results['results'], 1):
         print(f"\n{i}. Score: {result['relevance_score']:.3f}")
@@ -48,7 +73,8 @@ def main():
         print(f"   Content preview: {result['content']}")
         
     # Get answer
-    answer = query_engine.answer_question(query)
+    # Dùng lại kết quả search ở trên, không search lại
+    answer = answer_question(query, search_results=results)
     print(f"\n📋 Context sources: {answer['sources']}")
 
 if __name__ == "__main__":
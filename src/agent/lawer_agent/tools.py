@@ -2,32 +2,57 @@ import sys, os
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(BASE_DIR)
 
-from core.hierarchical_rag_system import HierarchicalRAGSystem
-from core.law_rag_query_engine import LegalRAGQueryEngine
+from core.retrieval_server import RetrievalClient, ServerUnavailableError
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DATA_PATH = os.path.join(BASE_DIR, "src/law_documents")
 
+# Budget (giây) cho một lần search của tool, hết budget thì bỏ các stage tùy chọn
+RAG_TOOL_DEADLINE_SECONDS = float(os.environ.get("LAW_RAG_DEADLINE_SECONDS", "3.0"))
+
+# Kết nối tới retrieval server nếu đang chạy (python3 -m core.retrieval_server)
+retrieval_client = RetrievalClient()
+
+# Fallback: RAG system trong process, chỉ load một lần
+_local_rag_system = None
+
+
+def _get_local_rag_system():
+  """Load RAG system trong process khi không có retrieval server"""
+  global _local_rag_system
+  
+  if _local_rag_system is None:
+    from core.hierarchical_rag_system import HierarchicalRAGSystem
+    
+    _local_rag_system = HierarchicalRAGSystem(
+      data_path=DATA_PATH,
+      embedding_model="sentence-transformers/all-MiniLM-L6-v2"
+    )
+    
+    if not _local_rag_system.has_existing_data():
+      _local_rag_system.build_index()
+      
+  return _local_rag_system
+
 
 def rag_tool(prompt_standardization: str) -> dict:
   """Tool using RAG techniques to answer legal questions"""
   
-  rag_system = HierarchicalRAGSystem(
-    data_path=DATA_PATH,
-    embedding_model="sentence-transformers/all-MiniLM-L6-v2"
-  )
-  
-  if not rag_system.has_existing_data():
-    rag_system.build_index()
-  
-  query_engine = LegalRAGQueryEngine(rag_system)
-  
-  results = rag_system.search(prompt_standardization, top_k=3)
-  # answer = query_engine.answer_question(prompt_standardization)
+  # Chỉ load RAG system trong process khi không có server nào chạy: server bận / lỗi không được
+  # fallback vì process thứ hai sẽ mở (và có thể ghi) cùng Chroma store với server
+  try:
+    results = retrieval_client.search(prompt_standardization, top_k=3, deadline=RAG_TOOL_DEADLINE_SECONDS)
+  except ServerUnavailableError:
+    results = _get_local_rag_system().search(prompt_standardization, top_k=3, deadline=RAG_TOOL_DEADLINE_SECONDS)
+  except (OSError, RuntimeError) as e:
+    return {
+      "query": prompt_standardization,
+      "search_results": [],
+      "error": f"Retrieval server error: {e}",
+    }
   
   return {
     "query": prompt_standardization,
     "search_results": results["results"],
-    # "answer": answer["answer"],
-    # "sources": answer["sources"]
+    "skipped_stages": results.get("skipped_stages", []),
   }
@@ -0,0 +1,316 @@
+import json
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+
+# Thứ tự chữ cái của Điểm trong văn bản pháp luật
+POINT_LETTERS = "abcdđeghiklmnopqrstuvxy"
+
+DOCUMENT_NUMBER_PATTERN = re.compile(
+  r"(\d+)\s*[/_]\s*(\d{4})\s*[/_]\s*([A-Za-zĐđ]+(?:\s*-\s*[A-Za-zĐđ]+)+)"
+)
+CHAPTER_PATTERN = re.compile(r"^Chương\s+([IVXLC]+|\d+)\b", re.IGNORECASE)
+ARTICLE_PATTERN = re.compile(r"^Điều\s+(\d+)\s*[.:]?\s*(.*)$")
+CLAUSE_PATTERN = re.compile(r"^(\d+)\.\s")
+POINT_PATTERN = re.compile(rf"^([{POINT_LETTERS}])\)\s")
+
+QUERY_ARTICLE_PATTERN = re.compile(r"\bđiều\s+(\d+)", re.IGNORECASE)
+QUERY_CLAUSE_PATTERN = re.compile(r"\bkhoản\s+(\d+)", re.IGNORECASE)
+QUERY_POINT_PATTERN = re.compile(rf"\bđiểm\s+([{POINT_LETTERS}])\b", re.IGNORECASE)
+
+
+def normalize_document_number(raw: str) -> str:
+  """Chuẩn hóa số hiệu văn bản: 209_2013_NĐ-CP -> 209/2013/ND-CP"""
+
+  text = unicodedata.normalize("NFD", raw.replace("Đ", "D").replace("đ", "d"))
+  text = "".join(c for c in text if not unicodedata.combining(c))
+  text = re.sub(r"\s+", "", text).replace("_", "/")
+  return text.upper()
+
+
+def _format_document_number(match) -> str:
+  suffix = re.sub(r"\s+", "", match.group(3))
+  return f"{match.group(1)}/{match.group(2)}/{suffix}"
+
+
+def parse_document_number(file_name: str, text: str = "") -> Optional[str]:
+  """Lấy số hiệu văn bản từ tên file, fallback sang dòng 'Số: ...' ở đầu văn bản"""
+
+  match = DOCUMENT_NUMBER_PATTERN.search(Path(file_name).stem)
+  if match:
+    return _format_document_number(match)
+
+  match = re.search(r"Số\s*:\s*" + DOCUMENT_NUMBER_PATTERN.pattern, text[:3000])
+  if match:
+    return _format_document_number(match)
+
+  return None
+
+
+def parse_structure(text: str) -> Dict[str, Dict]:
+  """
+  Parse cấu trúc Chương / Điều / Khoản / Điểm của văn bản thành spans ký tự.
+  Chỉ nhận heading theo đúng thứ tự (Điều N+1 sau Điều N, ...) để bỏ qua
+  các điều khoản được trích dẫn lại bên trong văn bản sửa đổi.
+  """
+
+  articles = {}
+  article = clause = point = None
+  chapter = ""
+
+  def close_point(end):
+    if point is not None:
+      point['end'] = end
+
+  def close_clause(end):
+    close_point(end)
+    if clause is not None:
+      clause['end'] = end
+
+  def close_article(end):
+    close_clause(end)
+    if article is not None:
+      article['end'] = end
+
+  for line_match in re.finditer(r"[^\n]+", text):
+    line = line_match.group(0).strip()
+    start = line_match.start() + (len(line_match.group(0)) - len(line_match.group(0).lstrip()))
+    if not line:
+      continue
+
+    chapter_match = CHAPTER_PATTERN.match(line)
+    if chapter_match:
+      close_article(line_match.start())
+      article = clause = point = None
+      chapter = chapter_match.group(1)
+      continue
+
+    article_match = ARTICLE_PATTERN.match(line)
+    if article_match:
+      number = int(article_match.group(1))
+      previous_number = int(article['number']) if article is not None else max(map(int, articles), default=0)
+      if number == previous_number + 1:
+        close_article(line_match.start())
+        clause = point = None
+        article = {
+          'number': str(number),
+          'title': article_match.group(2).strip(),
+          'chapter': chapter,
+          'start': start,
+          'end': len(text),
+          'clauses': {}
+        }
+        articles[article['number']] = article
+        continue
+
+    if article is None:
+      continue
+
+    clause_match = CLAUSE_PATTERN.match(line)
+    if clause_match:
+      number = int(clause_match.group(1))
+      previous_number = int(clause['number']) if clause is not None else 0
+      if number == previous_number + 1:
+        close_clause(start)
+        point = None
+        clause = {'number': str(number), 'start': start, 'end': article['end'], 'points': {}}
+        article['clauses'][clause['number']] = clause
+        continue
+
+    point_match = POINT_PATTERN.match(line)
+    if point_match and clause is not None:
+      letter = point_match.group(1)
+      previous_index = POINT_LETTERS.index(point['letter']) if point is not None else -1
+      if POINT_LETTERS.index(letter) == previous_index + 1:
+        close_point(start)
+        point = {'letter': letter, 'start': start, 'end': clause['end']}
+        clause['points'][letter] = point
+
+  close_article(len(text))
+  return articles
+
+
+class CitationIndex:
+  """Structural index: số hiệu văn bản + Điều / Khoản / Điểm -> document và span"""
+
+  def __init__(self, path: str):
+    self.path = path
+
+    # document_id -> {'document_number', 'articles': {số điều -> article}}
+    self.documents: Dict[str, Dict] = {}
+
+    # Số hiệu chuẩn hóa ("209/2013/ND-CP") và dạng rút gọn ("209/2013") -> document_ids
+    self.by_number: Dict[str, List[str]] = {}
+
+
+  def add_document(self, document_id: str, document_number: Optional[str], text: str) -> int:
+    """Parse và index một document, trả về số Điều tìm được"""
+
+    self.remove_document(document_id)
+    if not document_number:
+      return 0
+
+    articles = parse_structure(text)
+    if not articles:
+      return 0
+
+    # Lưu text của từng Điều, spans của Khoản / Điểm là vị trí tuyệt đối trong document
+    for article in articles.values():
+      article['text'] = text[article['start']:article['end']].strip()
+
+    self.documents[document_id] = {
+      'document_number': document_number,
+      'articles': articles
+    }
+    self._index_number(document_id, document_number)
+    return len(articles)
+
+
+  def _index_number(self, document_id: str, document_number: str):
+    key = normalize_document_number(document_number)
+    short_key = "/".join(key.split("/")[:2])
+    for k in (key, short_key):
+      ids = self.by_number.setdefault(k, [])
+      if document_id not in ids:
+        ids.append(document_id)
+
+
+  def remove_document(self, document_id: str):
+    """Xóa một document khỏi index"""
+
+    if self.documents.pop(document_id, None) is None:
+      return
+    for key in list(self.by_number):
+      if document_id in self.by_number[key]:
+        self.by_number[key].remove(document_id)
+        if not self.by_number[key]:
+          del self.by_number[key]
+
+
+  def parse_citation(self, query: str) -> Optional[Dict]:
+    """Nhận diện trích dẫn trong query, vd. 'khoản 2 Điều 5 Nghị định 209/2013/NĐ-CP'"""
+
+    article_match = QUERY_ARTICLE_PATTERN.search(query)
+    if not article_match:
+      return None
+
+    number_match = DOCUMENT_NUMBER_PATTERN.search(query)
+    if number_match:
+      key = normalize_document_number(f"{number_match.group(1)}/{number_match.group(2)}/{number_match.group(3)}")
+    else:
+      short_match = re.search(r"\b(\d+)\s*/\s*(\d{4})\b", query)
+      if not short_match:
+        return None
+      key = f"{short_match.group(1)}/{short_match.group(2)}"
+
+    clause_match = QUERY_CLAUSE_PATTERN.search(query)
+    point_match = QUERY_POINT_PATTERN.search(query)
+
+    return {
+      'document_key': key,
+      'article': article_match.group(1),
+      'clause': clause_match.group(1) if clause_match else None,
+      'point': point_match.group(1).lower() if point_match else None
+    }
+
+
+  def lookup(self, query: str) -> List[Dict]:
+    """Trả lời trực tiếp query có trích dẫn, list rỗng nếu không nhận diện được"""
+
+    citation = self.parse_citation(query)
+    if citation is None:
+      return []
+
+    document_ids = self.by_number.get(citation['document_key'])
+    if document_ids is None:
+      document_ids = self.by_number.get("/".join(citation['document_key'].split("/")[:2]), [])
+
+    hits = []
+    for document_id in document_ids:
+      hit = self._resolve(document_id, citation)
+      if hit is not None:
+        hits.append(hit)
+    return hits
+
+
+  def _resolve(self, document_id: str, citation: Dict) -> Optional[Dict]:
+    """Lấy text của provision được trích dẫn và các provisions liền kề"""
+
+    document = self.documents[document_id]
+    articles = document['articles']
+    article = articles.get(citation['article'])
+    if article is None:
+      return None
+
+    def article_slice(span: Dict) -> str:
+      return article['text'][span['start'] - article['start']:span['end'] - article['start']].strip()
+
+    label = f"Điều {article['number']}"
+    siblings = articles
+    key = article['number']
+    span = article
+    text = article['text']
+
+    clause = article['clauses'].get(citation['clause']) if citation['clause'] else None
+    if clause is not None:
+      label = f"Khoản {clause['number']} {label}"
+      siblings, key, span = article['clauses'], clause['number'], clause
+      text = article_slice(clause)
+
+      point = clause['points'].get(citation['point']) if citation['point'] else None
+      if point is not None:
+        label = f"Điểm {point['letter']} {label}"
+        siblings, key, span = clause['points'], point['letter'], point
+        text = article_slice(point)
+
+    # Provisions liền kề cùng cấp
+    keys = list(siblings)
+    position = keys.index(key)
+    neighbors = {}
+    for name, neighbor_position in (('previous', position - 1), ('next', position + 1)):
+      if 0 <= neighbor_position < len(keys):
+        neighbor = siblings[keys[neighbor_position]]
+        neighbors[name] = neighbor['text'] if siblings is articles else article_slice(neighbor)
+
+    return {
+      'document_id': document_id,
+      'document_number': document['document_number'],
+      'citation': f"{label} {document['document_number']}",
+      'article_title': article['title'],
+      'chapter': article['chapter'],
+      'span': [span['start'], span['end']],
+      'text': text,
+      'neighbors': neighbors
+    }
+
+
+  def save(self) -> None:
+    """Persist index ra file JSON (ghi file tạm rồi replace)"""
+
+    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+    tmp_path = f"{self.path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      json.dump({'documents': self.documents}, f, ensure_ascii=False)
+    os.replace(tmp_path, self.path)
+
+
+  def load(self) -> bool:
+    """Load index đã persist, trả về False nếu chưa có"""
+
+    if not os.path.exists(self.path):
+      return False
+
+    try:
+      with open(self.path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+      self.documents = data.get('documents', {})
+      self.by_number = {}
+      for document_id, document in self.documents.items():
+        self._index_number(document_id, document['document_number'])
+      return True
+    except Exception as e:
+      print(f"Error loading citation index from {self.path}: {e}")
+      return False
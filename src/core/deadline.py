@@ -0,0 +1,80 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Union
+
+
+class Deadline:
+  """
+  Thời hạn cho một request (tính bằng time.monotonic).
+  Deadline(None) không bao giờ hết hạn; các stage tùy chọn bị bỏ qua được ghi vào skipped_stages.
+  """
+
+  def __init__(self, timeout: Optional[float] = None, expires_at: Optional[float] = None):
+    if expires_at is None and timeout is not None:
+      expires_at = time.monotonic() + timeout
+    self.expires_at = expires_at
+    self.skipped_stages: List[str] = []
+
+
+  @classmethod
+  def coerce(cls, value: Union["Deadline", float, None]) -> "Deadline":
+    """
+    Chuẩn hóa tham số deadline:
+      - None: không giới hạn
+      - số: budget tính bằng giây kể từ bây giờ
+      - Deadline: dùng chung thời hạn nhưng ghi skipped_stages riêng
+    """
+    if isinstance(value, Deadline):
+      return cls(expires_at=value.expires_at)
+    return cls(timeout=value)
+
+
+  def remaining(self) -> float:
+    """Số giây còn lại, inf nếu không giới hạn"""
+    if self.expires_at is None:
+      return float("inf")
+    return self.expires_at - time.monotonic()
+
+
+  def expired(self) -> bool:
+    return self.remaining() <= 0
+
+
+  def allows(self, stage: str, reserve: float = 0.0) -> bool:
+    """Còn đủ thời gian cho stage (reserve = thời gian ước tính stage + các stage bắt buộc sau nó)?"""
+
+    if self.remaining() > reserve:
+      return True
+    self.skipped_stages.append(stage)
+    return False
+
+
+class StageLatencies:
+  """EWMA thời gian chạy của từng stage, dùng để ước tính budget cần cho các stage còn lại"""
+
+  def __init__(self, alpha: float = 0.2):
+    self.alpha = alpha
+    self._estimates: Dict[str, float] = {}
+    self._lock = threading.Lock()
+
+
+  def observe(self, stage: str, seconds: float):
+    with self._lock:
+      previous = self._estimates.get(stage)
+      self._estimates[stage] = seconds if previous is None else (1 - self.alpha) * previous + self.alpha * seconds
+
+
+  def estimate(self, *stages: str) -> float:
+    """Tổng thời gian ước tính của các stages (0 nếu chưa đo lần nào)"""
+    with self._lock:
+      return sum(self._estimates.get(stage, 0.0) for stage in stages)
+
+
+  @contextmanager
+  def measure(self, stage: str):
+    start = time.monotonic()
+    try:
+      yield
+    finally:
+      self.observe(stage, time.monotonic() - start)
@@ -0,0 +1,175 @@
+import json
+import os
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+
+
+class FolderTree:
+  """
+  Cây folders với summary vectors cho beam search coarse-to-fine:
+  summary vector của một folder = vector của chính nó kết hợp với summary vectors của các folders con.
+  """
+
+  def __init__(self, path: str, self_weight: float = 0.5):
+    self.path = path
+    self.self_weight = self_weight
+
+    self.folder_ids: List[str] = []
+    self.parents: Dict[str, Optional[str]] = {}
+    self.children: Dict[Optional[str], List[str]] = {}
+
+    # Vector của chính folder và summary vector của cả subtree (đã chuẩn hóa L2)
+    self.vectors = np.zeros((0, 0), dtype=np.float32)
+    self.summaries = np.zeros((0, 0), dtype=np.float32)
+    self._position: Dict[str, int] = {}
+
+
+  @staticmethod
+  def _normalize(vectors) -> np.ndarray:
+    """Chuẩn hóa L2 để dot product = cosine similarity"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+  def _link(self):
+    """Tạo lại children map và positions từ folder_ids / parents"""
+
+    self._position = {folder_id: i for i, folder_id in enumerate(self.folder_ids)}
+    self.children = {}
+    for folder_id in self.folder_ids:
+      self.children.setdefault(self.parents.get(folder_id), []).append(folder_id)
+
+
+  def _depths(self) -> Dict[str, int]:
+    """Độ sâu của từng folder; parent không hợp lệ hoặc có vòng -> coi là folder gốc"""
+
+    depths = {}
+    for folder_id in self.folder_ids:
+      path = []
+      node = folder_id
+      while node is not None and node not in depths and node not in path:
+        path.append(node)
+        node = self.parents.get(node)
+
+      if node is not None and node in path:
+        # Vòng lặp trong parent hints: cắt tại node đầu tiên của vòng
+        self.parents[node] = None
+        depth = -1
+        path = path[:path.index(node) + 1]
+      else:
+        depth = depths.get(node, -1)
+
+      for node in reversed(path):
+        depth += 1
+        depths[node] = depth
+
+    return depths
+
+
+  def build(self, folder_ids: List[str], vectors, parents: Dict[str, Optional[str]]) -> None:
+    """Build cây và tính summary vectors từ dưới lên"""
+
+    self.folder_ids = list(folder_ids)
+    known = set(self.folder_ids)
+    self.parents = {
+      folder_id: parents.get(folder_id) if parents.get(folder_id) in known else None
+      for folder_id in self.folder_ids
+    }
+    depths = self._depths()
+    self._link()
+
+    self.vectors = self._normalize(vectors) if self.folder_ids else np.zeros((0, 0), dtype=np.float32)
+    self.summaries = self.vectors.copy()
+
+    # Folders sâu nhất trước để summary của con đã có khi tính cha
+    for folder_id in sorted(self.folder_ids, key=lambda folder_id: depths[folder_id], reverse=True):
+      child_ids = self.children.get(folder_id)
+      if not child_ids:
+        continue
+      position = self._position[folder_id]
+      child_summary = self.summaries[[self._position[child_id] for child_id in child_ids]].mean(axis=0)
+      self.summaries[position] = self._normalize(
+        self.self_weight * self.vectors[position] + (1 - self.self_weight) * child_summary
+      )
+
+
+  def beam_search(self, query_vector, beam_width: int = 5) -> List[Tuple[str, float, float]]:
+    """
+    Beam search từ các folders gốc xuống:
+      mỗi tầng chỉ chấm điểm con của các folders trong beam, giữ beam_width folders có summary score cao nhất.
+    Trả về [(folder_id, similarity của folder, similarity của subtree), ...] sort theo similarity giảm dần.
+    """
+
+    if not self.folder_ids:
+      return []
+
+    query = self._normalize(query_vector)
+    selected = []
+    candidates = self.children.get(None, [])
+
+    while candidates:
+      positions = [self._position[folder_id] for folder_id in candidates]
+      summary_scores = self.summaries[positions] @ query
+      own_scores = self.vectors[positions] @ query
+
+      beam = np.argsort(-summary_scores, kind='stable')[:beam_width]
+      selected.extend((candidates[i], float(own_scores[i]), float(summary_scores[i])) for i in beam)
+
+      candidates = [child_id for i in beam for child_id in self.children.get(candidates[i], [])]
+
+    selected.sort(key=lambda item: item[1], reverse=True)
+    return selected
+
+
+  def vector(self, folder_id: str) -> Optional[np.ndarray]:
+    """Vector (đã chuẩn hóa) của một folder, None nếu không có trong cây"""
+    position = self._position.get(folder_id)
+    return None if position is None else self.vectors[position]
+
+
+  def subtree(self, folder_id: str) -> List[str]:
+    """Folder và tất cả folders con cháu"""
+
+    folder_ids = [folder_id]
+    for current in folder_ids:
+      folder_ids.extend(self.children.get(current, []))
+    return folder_ids
+
+
+  def save(self) -> None:
+    """Persist cây ra file JSON (ghi file tạm rồi replace)"""
+
+    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+    tmp_path = f"{self.path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      json.dump({
+        'self_weight': self.self_weight,
+        'folder_ids': self.folder_ids,
+        'parents': self.parents,
+        'vectors': np.round(self.vectors, 6).tolist(),
+        'summaries': np.round(self.summaries, 6).tolist()
+      }, f)
+    os.replace(tmp_path, self.path)
+
+
+  def load(self) -> bool:
+    """Load cây đã persist, trả về False nếu chưa có"""
+
+    if not os.path.exists(self.path):
+      return False
+
+    try:
+      with open(self.path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+      self.self_weight = data.get('self_weight', self.self_weight)
+      self.folder_ids = data.get('folder_ids', [])
+      self.parents = data.get('parents', {})
+      self.vectors = np.asarray(data.get('vectors', []), dtype=np.float32)
+      self.summaries = np.asarray(data.get('summaries', []), dtype=np.float32)
+      self._link()
+      return True
+    except Exception as e:
+      print(f"Error loading folder tree from {self.path}: {e}")
+      return False
@@ -1,62 +1,377 @@
 
 
 from sentence_transformers import SentenceTransformer
+import sentence_transformers
 import chromadb
 from chromadb.config import Settings
 from core.legal_document_processor import LegalDocumentProcessor
-from typing import List, Dict, Any, Optional, Tuple
+from core.index_generations import IndexGeneration, IndexManifest
+from core.folder_tree import FolderTree
+from core.citation_index import parse_document_number, normalize_document_number
+from core.index_snapshot import export_snapshot, load_snapshot, read_snapshot_manifest, check_model_compatibility
+from core.deadline import Deadline, StageLatencies
+from typing import List, Dict, Any, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import hashlib
 import os
-from models.schema import FolderMetadata
-from dataclasses import dataclass, asdict
+import threading
+import time
+import numpy as np
+from models.schema import FolderMetadata, ChunkCandidate
+from dataclasses import dataclass, asdict, replace
 from pathlib import Path
 
 
 
 class HierarchicalRAGSystem:
   """Main RAG system with hierarchical structure support"""
+  
+  QUERY_ENHANCEMENT_MODES = ("vector", "text", "none")
 
   def __init__(
     self,
     data_path: str,
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
-    persist_directory: str = "./db/chroma_db"
+    persist_directory: str = "./db/chroma_db",
+    shard_workers: int = 4,
+    keep_generations: int = 2,
+    min_chunk_ratio: float = 0.5,
+    query_enhancement: str = "text",
+    query_weight: float = 0.7,
+    enhancement_folders: int = 3
   ):
     
     self.data_path = data_path
     self.persist_directory = persist_directory
     
+    # Enhance query với folder context: "vector" (trộn embeddings, một lần encode), "text" (encode lại prefix), "none"
+    if query_enhancement not in self.QUERY_ENHANCEMENT_MODES:
+      raise ValueError(f"Unknown query enhancement mode: {query_enhancement}")
+    self.query_enhancement = query_enhancement
+    self.query_weight = query_weight
+    self.enhancement_folders = enhancement_folders
+    
     # Initialize embeeding model
+    self.embedding_model_name = embedding_model
     self.embedding_model = SentenceTransformer(embedding_model)
     
     # Initialize ChromaDB
     self.chroma_client = chromadb.PersistentClient(path=persist_directory)
     
-    # Collection cho different levels
-    self.folder_collection = self._get_or_create_collection("folder_metadata")
-    self.document_collection = self._get_or_create_collection("document_chunks")
+    # Thread pool cho fan-out query song song trên các shards
+    self.shard_executor = ThreadPoolExecutor(max_workers=shard_workers)
+    
+    # Thời gian chạy từng stage của search, để bỏ stage tùy chọn khi sắp hết deadline
+    self.stage_latencies = StageLatencies()
     
     # Document processor
     self.processor = LegalDocumentProcessor()
     
-    # Cache cho folder metadata
-    self.folder_cache = {}
+    # Index generations: rebuild ghi vào generation mới rồi mới switch readers
+    self.keep_generations = keep_generations
+    self.min_chunk_ratio = min_chunk_ratio
+    self.manifest = IndexManifest(os.path.join(persist_directory, "index_manifest.json"))
+    if not self.manifest.load():
+      # DB cũ (trước khi có generations) là generation 0
+      self.manifest.active = 0
+      
+    self._pinned = threading.local()
+    self._rebuild_lock = threading.Lock()
+    
+    # Số readers đang pin từng generation; generation bị loại chỉ drop khi không còn reader
+    self._readers: Dict[int, int] = {}
+    self._retired: Dict[int, IndexGeneration] = {}
+    self._readers_lock = threading.Lock()
+    
+    # Generation number lớn nhất đã cấp cho một lần build / import (kể cả đang chạy nền)
+    self._allocated_generation = self.manifest.active
+    self._allocate_lock = threading.Lock()
     
     # Check if DB already exists and load cache
-    self._load_existing_folder_cache()
+    self.active_index = self._open_generation(self.manifest.active)
     
 
 
-  def _get_or_create_collection(self, name: str):
-    """Tạo hoặc lấy collection từ ChromaDB"""
+  @property
+  def index(self) -> IndexGeneration:
+    """Generation đang dùng: generation được pin cho thread hiện tại, hoặc generation active"""
+    return getattr(self._pinned, 'index', None) or self.active_index
+
+
+  @contextmanager
+  def _use_generation(self, generation: Optional[IndexGeneration] = None):
+    """
+    Pin một generation cho thread hiện tại (search đọc nhất quán, rebuild ghi vào generation mới).
+    generation=None: generation đang dùng, lấy cùng lúc với tăng reader count để không bị drop giữa chừng.
+    """
     
+    with self._readers_lock:
+      generation = generation or self.index
+      self._readers[generation.generation] = self._readers.get(generation.generation, 0) + 1
+      
+    previous = getattr(self._pinned, 'index', None)
+    self._pinned.index = generation
     try:
-      return self.chroma_client.get_collection(name)
-    except:
-      return self.chroma_client.create_collection(
-        name=name,
-        metadata={"hnsw:space": "cosine"}
+      yield generation
+    finally:
+      self._pinned.index = previous
+      self._release_generation(generation.generation)
+
+
+  def _release_generation(self, generation_number: int):
+    """Giảm reader count, drop generation đã bị loại khi reader cuối cùng kết thúc"""
+    
+    with self._readers_lock:
+      self._readers[generation_number] -= 1
+      if self._readers[generation_number]:
+        return
+      del self._readers[generation_number]
+      retired = self._retired.pop(generation_number, None)
+      
+    if retired is not None:
+      print(f"---> Dropping index generation {generation_number}")
+      retired.drop()
+
+
+  def _retire_generation(self, generation: IndexGeneration):
+    """Drop generation ngay nếu không có reader, ngược lại để reader cuối cùng drop"""
+    
+    with self._readers_lock:
+      if self._readers.get(generation.generation):
+        self._retired[generation.generation] = generation
+        return
+      
+    print(f"---> Dropping index generation {generation.generation}")
+    generation.drop()
+
+
+  def _allocate_generation(self) -> int:
+    """Cấp số generation cho một lần build / import, không trùng với lần đang chạy"""
+    
+    with self._allocate_lock:
+      self._allocated_generation = max(self.manifest.next_generation(), self._allocated_generation + 1)
+      return self._allocated_generation
+
+
+  @property
+  def folder_collection(self):
+    return self.index.folder_collection
+
+
+  @property
+  def document_vector_collection(self):
+    return self.index.document_vector_collection
+
+
+  @property
+  def document_shards(self) -> Dict:
+    return self.index.document_shards
+
+
+  @property
+  def folder_cache(self) -> Dict:
+    return self.index.folder_cache
+
+
+  @property
+  def document_cache(self) -> Dict:
+    return self.index.document_cache
+
+
+  @property
+  def folder_tree(self):
+    return self.index.folder_tree
+
+
+  @property
+  def related_graph(self):
+    return self.index.related_graph
+
+
+  @property
+  def citation_index(self):
+    return self.index.citation_index
+
+
+  @property
+  def duplicate_index(self):
+    return self.index.duplicate_index
+
+
+  def _open_generation(self, generation_number: int) -> IndexGeneration:
+    """Mở một generation đã có và load caches của nó"""
+    
+    generation = IndexGeneration(generation_number, self.chroma_client, self.persist_directory)
+    
+    with self._use_generation(generation):
+      generation.load_shards()
+      self._load_existing_folder_cache()
+      self._load_existing_document_cache()
+      if not self.folder_tree.load() and self.folder_cache:
+        # Index cũ chưa có folder tree -> build từ folder vectors đã lưu
+        self.build_folder_tree()
+      self.related_graph.load()
+      self.citation_index.load()
+      self.duplicate_index.load()
+      
+    return generation
+
+
+  def _get_document_shard(self, legal_domain: str):
+    """Lấy hoặc tạo shard collection cho legal_domain"""
+    return self.index.get_or_create_shard(legal_domain)
+
+
+  def _shard_for_folder(self, folder_id: str):
+    """Shard chứa chunks của một folder"""
+    
+    folder_meta = self.folder_cache.get(folder_id)
+    if folder_meta is None:
+      return None
+    return self.document_shards.get(folder_meta.legal_domain)
+
+
+  def _route_shards(
+    self,
+    folder_ids: List[str],
+    legal_category_filter: Optional[str] = None
+  ) -> Dict[str, List[str]]:
+    """
+    Chọn shards cần query từ danh sách folders:
+      legal_domain -> folder_ids thuộc shard đó (list rỗng = không lọc folder)
+    """
+    
+    if not folder_ids:
+      routes = {domain: [] for domain in self.document_shards}
+    else:
+      routes = {}
+      for folder_id in folder_ids:
+        folder_meta = self.folder_cache.get(folder_id)
+        if folder_meta is not None and folder_meta.legal_domain in self.document_shards:
+          routes.setdefault(folder_meta.legal_domain, []).append(folder_id)
+          
+    if legal_category_filter is not None:
+      routes = {domain: ids for domain, ids in routes.items() if domain == legal_category_filter}
+      
+    return routes
+
+
+  def _query_shard(
+    self,
+    legal_domain: str,
+    shard,
+    folder_ids: List[str],
+    query_embedding: List[float],
+    n_results: int
+  ) -> List[ChunkCandidate]:
+    """Query một shard (chỉ lấy ids, metadata gọn và distances), lọc theo folders nếu có"""
+    
+    where_clause = {"folder_id": {"$in": folder_ids}} if folder_ids else None
+    
+    result = shard.query(
+      query_embeddings=[query_embedding],
+      n_results=n_results,
+      where=where_clause,
+      include=['metadatas', 'distances']
+    )
+    
+    return [
+      ChunkCandidate(
+        chunk_id=chunk_id,
+        document_id=metadata.get('document_id', ''),
+        folder_id=metadata.get('folder_id', ''),
+        legal_domain=legal_domain,
+        distance=distance
       )
+      for chunk_id, metadata, distance in zip(result['ids'][0], result['metadatas'][0], result['distances'][0])
+    ]
+
+
+  def _query_document_shards(self, routes: Dict[str, List[str]], query_embedding: List[float], n_results: int) -> List[ChunkCandidate]:
+    """
+    Fan-out query song song lên các shards rồi merge kết quả.
+    Mọi shard dùng cùng embedding model và cosine space nên distance so sánh trực tiếp được.
+    """
+    
+    # Resolve shards ở thread hiện tại (thread pool không thấy generation được pin)
+    shards = self.document_shards
+    
+    if len(routes) == 1:
+      (legal_domain, folder_ids), = routes.items()
+      shard_results = [self._query_shard(legal_domain, shards[legal_domain], folder_ids, query_embedding, n_results)]
+    else:
+      futures = [
+        self.shard_executor.submit(self._query_shard, legal_domain, shards[legal_domain], folder_ids, query_embedding, n_results)
+        for legal_domain, folder_ids in routes.items()
+      ]
+      shard_results = [future.result() for future in futures]
+      
+    candidates = [candidate for result in shard_results for candidate in result]
+    candidates.sort(key=lambda candidate: candidate.distance)
+    
+    return candidates[:n_results]
+
+
+  def _hydrate_candidates(self, candidates: List[ChunkCandidate]) -> List[Dict]:
+    """Lấy content + metadata cho kết quả cuối cùng, một lần get cho mỗi shard"""
+    
+    shards = self.document_shards
+    by_shard = {}
+    for candidate in candidates:
+      by_shard.setdefault(candidate.legal_domain, []).append(candidate.chunk_id)
+      
+    records = {}
+    for legal_domain, chunk_ids in by_shard.items():
+      fetched = shards[legal_domain].get(ids=chunk_ids, include=['documents', 'metadatas'])
+      for chunk_id, content, metadata in zip(fetched['ids'], fetched['documents'], fetched['metadatas']):
+        records[chunk_id] = (content, metadata)
+        
+    results = []
+    for candidate in candidates:
+      if candidate.chunk_id not in records:
+        continue
+      content, metadata = records[candidate.chunk_id]
+      
+      results.append({
+        'chunk_id': candidate.chunk_id,
+        'content': content,
+        'metadata': self._join_chunk_metadata(metadata),
+        'doc_similarity': candidate.doc_similarity,
+        'folder_similarity': candidate.folder_similarity,
+        'combined_score': candidate.combined_score,
+        'authority_score': candidate.authority_score,
+        'duplicate_sources': self._duplicate_sources(candidate)
+      })
+      
+    return results
+
+
+  def _duplicate_sources(self, candidate: ChunkCandidate) -> List[Dict]:
+    """Các documents khác có cùng nội dung với chunk (bỏ qua lúc ingestion hoặc gộp lúc query)"""
+    
+    document_ids = self.duplicate_index.alias_documents(candidate.chunk_id)
+    for chunk_id in candidate.duplicate_ids:
+      document_id = chunk_id.split('_chunk_')[0]
+      if document_id != candidate.document_id and document_id not in document_ids:
+        document_ids.append(document_id)
+        
+    sources = []
+    for document_id in document_ids:
+      document_meta = self.document_cache.get(document_id, {})
+      folder_meta = self.folder_cache.get(document_meta.get('folder_id'))
+      sources.append({
+        'document_id': document_id,
+        'folder': folder_meta.folder_name if folder_meta else '',
+        'file': document_meta.get('file_name', '')
+      })
+      
+    return sources
+
+
+  def _count_document_chunks(self) -> int:
+    """Tổng số chunks trên tất cả shards"""
+    return self.index.count_chunks()
 
 
   def _generate_folder_id(self, folder_path: str) -> str:
@@ -105,17 +420,10 @@ class HierarchicalRAGSystem:
 
         
         # Store trong ChromaDB
-        metadata_dict = asdict(folder_meta)
-        if isinstance(metadata_dict.get("keywords"), list):
-          metadata_dict["keywords"] = ", ".join(metadata_dict["keywords"])
-        for key, value in metadata_dict.items():
-          if value is None:
-              metadata_dict[key] = ""
-
         self.folder_collection.add(
           embeddings=[folder_embedding[0].tolist()],
           documents=[folder_text],
-          metadatas=[metadata_dict],
+          metadatas=[self._folder_metadata_dict(folder_meta)],
           ids=[folder_id]
         )
         
@@ -123,6 +431,65 @@ class HierarchicalRAGSystem:
 
 
 
+  def _folder_metadata_dict(self, folder_meta: FolderMetadata) -> Dict:
+    """FolderMetadata -> metadata dict lưu trong ChromaDB (keywords nối thành string, không có None)"""
+    
+    metadata_dict = asdict(folder_meta)
+    if isinstance(metadata_dict.get("keywords"), list):
+      metadata_dict["keywords"] = ", ".join(metadata_dict["keywords"])
+    for key, value in metadata_dict.items():
+      if value is None:
+        metadata_dict[key] = ""
+    return metadata_dict
+
+
+
+  def _resolve_folder_parents(self, folder_ids: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Folder cha của từng folder: thư mục tổ tiên gần nhất cũng được index,
+    fallback sang parent_folder (tên hoặc id) trong meta.json
+    """
+    
+    by_path = {os.path.normpath(meta.folder_path): folder_id for folder_id, meta in self.folder_cache.items()}
+    by_name = {meta.folder_name: folder_id for folder_id, meta in self.folder_cache.items()}
+    
+    parents = {}
+    for folder_id in folder_ids:
+      folder_meta = self.folder_cache.get(folder_id)
+      parents[folder_id] = None
+      if folder_meta is None:
+        continue
+      
+      path = os.path.dirname(os.path.normpath(folder_meta.folder_path))
+      while path and path != os.path.dirname(path):
+        if path in by_path:
+          parents[folder_id] = by_path[path]
+          break
+        path = os.path.dirname(path)
+        
+      if parents[folder_id] is None and folder_meta.parent_folder:
+        parents[folder_id] = by_name.get(folder_meta.parent_folder, folder_meta.parent_folder)
+        
+    return parents
+
+
+
+  def build_folder_tree(self) -> int:
+    """Build cây folders + summary vectors (aggregate từ folders con) cho beam search"""
+    
+    folders = self.folder_collection.get(include=['embeddings'])
+    folder_ids = folders['ids']
+    
+    # Build vào cây mới rồi mới swap, search đang chạy vẫn đọc cây cũ nguyên vẹn
+    folder_tree = FolderTree(self.folder_tree.path, self.folder_tree.self_weight)
+    folder_tree.build(folder_ids, folders['embeddings'], self._resolve_folder_parents(folder_ids))
+    folder_tree.save()
+    self.index.folder_tree = folder_tree
+    
+    return len(folder_tree.children.get(None, []))
+
+
+
   def index_documents(self) -> int:
     """Index tất cả documents trong folders"""
     
@@ -135,61 +502,315 @@ class HierarchicalRAGSystem:
       files = [f for f in os.listdir(folder_path) if f != 'meta.json' and os.path.isfile(os.path.join(folder_path, f))]
       
       for file_name in files:
-        file_path = os.path.join(folder_path, file_name)
-        
-        # Extract text từ file
-        text_content = self.processor.extract_text_from_file(file_path)
-        
-        if not text_content.strip():
-          continue
-        
-        # Tạo document metadata
-        document_id = hashlib.md5(file_path.encode()).hexdigest()
-        
-        base_metadata = {
-          'document_id': document_id,
-          'folder_path': folder_path,
-          'folder_name': folder_meta.folder_name,
-          'folder_id': folder_id,
-          'file_name': file_name,
-          'file_type': Path(file_name).suffix,
-          'folder_meta_summary': folder_meta.description,
-          'legal_category': folder_meta.legal_domain,
-          'folder_keywords': folder_meta.keywords
-        }
+        _, chunk_count = self._index_document_file(folder_id, folder_meta, file_name)
+        total_chunks += chunk_count
+
+    return total_chunks
+
+
+
+  def _index_document_file(self, folder_id: str, folder_meta: FolderMetadata, file_name: str) -> Tuple[Optional[str], int]:
+    """Index một file: chunks + document vector. Trả về (document_id, số chunks)"""
+    
+    folder_path = folder_meta.folder_path
+    file_path = os.path.join(folder_path, file_name)
+    
+    # Extract text từ file
+    text_content = self.processor.extract_text_from_file(file_path)
+    
+    if not text_content.strip():
+      return None, 0
+    
+    # Tạo document metadata
+    document_id = hashlib.md5(file_path.encode()).hexdigest()
+    
+    # Document trùng nội dung với document đã index (vd. cùng văn bản PDF + DOCX) -> không embed lại
+    canonical_document, document_fingerprint = self.duplicate_index.find_duplicate_document(text_content)
+    if canonical_document in self.document_cache and canonical_document != document_id:
+      return self._index_duplicate_document(document_id, canonical_document, folder_id, file_name, text_content)
+    
+    # Chunk chỉ lưu keys gọn, folder/document metadata được join lúc query
+    base_metadata = {
+      'document_id': document_id,
+      'folder_id': folder_id
+    }
+    
+    # Chunk document
+    chunks = self.processor.chunk_document(text_content, base_metadata)
+    
+    if not chunks:
+      return None, 0
+    
+    self.duplicate_index.register_document(document_id, document_fingerprint)
+    
+    # Chunk trùng nội dung với chunk đã index (vd. điều khoản được trích lại trong văn bản sửa đổi) chỉ ghi alias.
+    # Chunk gần trùng (vd. điều khoản sửa đổi một con số) vẫn lưu text + metadata riêng, chỉ dùng lại vector
+    new_chunks = []
+    similar_chunks = {}
+    aliased_chunks = {}
+    for chunk_data in chunks:
+      canonical_chunk, chunk_fingerprint = self.duplicate_index.find_duplicate_chunk(chunk_data['text'])
+      if canonical_chunk is not None:
+        self.duplicate_index.add_chunk_alias(chunk_data['id'], canonical_chunk)
+        aliased_chunks[chunk_data['id']] = canonical_chunk
         
-        # Chunk document
-        chunks = self.processor.chunk_document(text_content, base_metadata)
-
-        for chunk_data in chunks:
-          # Sanitize metadata giống index_folders
-          metadata_dict = chunk_data['metadata']
-          for key, value in metadata_dict.items():
-            if isinstance(value, list):
-              metadata_dict[key] = ", ".join(value)
-            elif value is None:
-              metadata_dict[key] = ""
-
-          # Tạo enhanced text cho embedding
-          enhanced_text = self._create_enhanced_chunk_text(
-            chunk_data['text'],
-            metadata_dict
-          )
+        canonical_folder = self.document_cache.get(canonical_chunk.split('_chunk_')[0], {}).get('folder_id', folder_id)
+        self.duplicate_index.link_folders(folder_id, canonical_folder)
+        continue
+      
+      similar_chunk = self.duplicate_index.find_similar_chunk(chunk_fingerprint)
+      if similar_chunk is not None and not similar_chunk.startswith(f"{document_id}_chunk_"):
+        chunk_data['metadata'] = {**chunk_data['metadata'], 'near_duplicate_of': similar_chunk}
+        similar_chunks[chunk_data['id']] = similar_chunk
+        
+      self.duplicate_index.register_chunk(chunk_data['id'], chunk_fingerprint)
+      new_chunks.append(chunk_data)
+      
+    # Vectors đã lưu của các bản canonical; chunk gần trùng không lấy được vector thì embed bình thường
+    stored_vectors = self._get_chunk_embeddings(list(similar_chunks.values()) + list(aliased_chunks.values()))
+    reused_vectors = {
+      chunk_id: stored_vectors[similar_chunk]
+      for chunk_id, similar_chunk in similar_chunks.items() if similar_chunk in stored_vectors
+    }
+    embed_chunks = [chunk_data for chunk_data in new_chunks if chunk_data['id'] not in reused_vectors]
 
-          # Generate embedding
-          embedding = self.embedding_model.encode([enhanced_text])
+    # Tạo enhanced text cho embedding với context từ folder metadata
+    folder_context = {
+      'legal_category': folder_meta.legal_domain,
+      'folder_meta_summary': folder_meta.description,
+      'folder_keywords': folder_meta.keywords
+    }
+    enhanced_texts = [
+      self._create_enhanced_chunk_text(chunk_data['text'], folder_context)
+      for chunk_data in embed_chunks
+    ]
 
-          # Store trong ChromaDB
-          self.document_collection.add(
-            embeddings=[embedding[0].tolist()],
-            documents=[chunk_data['text']],
-            metadatas=[metadata_dict],
-            ids=[chunk_data['id']]
-          )
+    vectors_by_id = dict(reused_vectors)
+    if embed_chunks:
+      # Generate embeddings cho cả document một lần
+      embeddings = self.embedding_model.encode(enhanced_texts)
+      for chunk_data, embedding in zip(embed_chunks, embeddings):
+        vectors_by_id[chunk_data['id']] = embedding.tolist()
+
+    chunk_vectors = [vectors_by_id[chunk_data['id']] for chunk_data in new_chunks]
+    if new_chunks:
+      # Store trong shard của legal_domain
+      self._get_document_shard(folder_meta.legal_domain).add(
+        embeddings=chunk_vectors,
+        documents=[chunk_data['text'] for chunk_data in new_chunks],
+        metadatas=[chunk_data['metadata'] for chunk_data in new_chunks],
+        ids=[chunk_data['id'] for chunk_data in new_chunks]
+      )
+      
+    # Chunks trùng dùng lại vector của bản canonical
+    chunk_vectors.extend(
+      stored_vectors[canonical_chunk] for canonical_chunk in aliased_chunks.values() if canonical_chunk in stored_vectors
+    )
+    
+    # Document vector = centroid của chunk vectors
+    centroid = np.asarray(chunk_vectors, dtype=np.float32).mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    if norm > 0:
+      centroid = centroid / norm
+      
+    document_metadata = {
+      'document_id': document_id,
+      'folder_id': folder_id,
+      'file_name': file_name,
+      'file_type': Path(file_name).suffix,
+      'total_chunks': len(chunks),
+      'duplicate_chunks': len(aliased_chunks),
+      'near_duplicate_chunks': len(similar_chunks)
+    }
+    
+    self.document_vector_collection.upsert(
+      embeddings=[centroid.tolist()],
+      metadatas=[document_metadata],
+      ids=[document_id]
+    )
+    self.document_cache[document_id] = document_metadata
+    
+    # Parse số hiệu + Điều / Khoản / Điểm cho citation lookup
+    self.citation_index.add_document(
+      document_id,
+      parse_document_number(file_name, text_content),
+      text_content
+    )
 
-          total_chunks += 1
+    return document_id, len(new_chunks)
 
-    return total_chunks
+
+
+  def _index_duplicate_document(
+    self,
+    document_id: str,
+    canonical_document: str,
+    folder_id: str,
+    file_name: str,
+    text_content: str
+  ) -> Tuple[Optional[str], int]:
+    """Ghi document trùng làm alias của document canonical: dùng chung chunks và document vector"""
+    
+    self.duplicate_index.add_document_alias(document_id, canonical_document)
+    self.duplicate_index.link_folders(folder_id, self.document_cache[canonical_document]['folder_id'])
+    
+    canonical_vector = self.document_vector_collection.get(ids=[canonical_document], include=['embeddings'])
+    
+    document_metadata = {
+      'document_id': document_id,
+      'folder_id': folder_id,
+      'file_name': file_name,
+      'file_type': Path(file_name).suffix,
+      'total_chunks': self.document_cache[canonical_document].get('total_chunks', 0),
+      'duplicate_of': canonical_document
+    }
+    
+    self.document_vector_collection.upsert(
+      embeddings=[list(canonical_vector['embeddings'][0])],
+      metadatas=[document_metadata],
+      ids=[document_id]
+    )
+    self.document_cache[document_id] = document_metadata
+    
+    # Vẫn index citations để trích dẫn được theo cả hai nguồn
+    self.citation_index.add_document(
+      document_id,
+      parse_document_number(file_name, text_content),
+      text_content
+    )
+    
+    return document_id, 0
+
+
+
+  def _get_chunk_embeddings(self, chunk_ids: List[str]) -> Dict[str, List[float]]:
+    """Lấy vectors đã lưu của các chunks (chunk_id -> vector), chunk có thể ở shard bất kỳ"""
+    
+    if not chunk_ids:
+      return {}
+    
+    vectors = {}
+    for shard in self.document_shards.values():
+      missing = [chunk_id for chunk_id in dict.fromkeys(chunk_ids) if chunk_id not in vectors]
+      if not missing:
+        break
+      fetched = shard.get(ids=missing, include=['embeddings'])
+      for chunk_id, embedding in zip(fetched['ids'], fetched['embeddings']):
+        vectors[chunk_id] = list(embedding)
+        
+    return vectors
+
+
+
+  def update_documents(self, file_paths: List[str]) -> Dict:
+    """Index lại các files đã thay đổi và cập nhật incremental related-documents graph"""
+    
+    folder_by_path = {meta.folder_path: (folder_id, meta) for folder_id, meta in self.folder_cache.items()}
+    changed_ids = []
+    removed_ids = []
+    aliased_ids = []
+    total_chunks = 0
+    
+    pending = list(dict.fromkeys(file_paths))
+    while pending:
+      file_path = pending.pop(0)
+      document_id = hashlib.md5(file_path.encode()).hexdigest()
+      
+      # Documents đang trỏ vào chunks của document này phải index lại (không còn bản canonical)
+      for orphan_id in self.duplicate_index.remove_document(document_id):
+        orphan_meta = self.document_cache.get(orphan_id)
+        orphan_folder = self.folder_cache.get(orphan_meta['folder_id']) if orphan_meta else None
+        if orphan_folder is not None:
+          orphan_path = os.path.join(orphan_folder.folder_path, orphan_meta['file_name'])
+          if orphan_path not in pending:
+            pending.append(orphan_path)
+      
+      # Xóa chunks cũ của document
+      folder = folder_by_path.get(os.path.dirname(file_path))
+      shards = [self._shard_for_folder(folder[0])] if folder else list(self.document_shards.values())
+      for shard in shards:
+        if shard is not None:
+          shard.delete(where={"document_id": document_id})
+      
+      if folder is None or not os.path.isfile(file_path):
+        self.document_vector_collection.delete(ids=[document_id])
+        self.document_cache.pop(document_id, None)
+        self.citation_index.remove_document(document_id)
+        removed_ids.append(document_id)
+        continue
+      
+      indexed_id, chunk_count = self._index_document_file(folder[0], folder[1], os.path.basename(file_path))
+      if indexed_id and self.document_cache[indexed_id].get('duplicate_of'):
+        # Document trở thành bản trùng: không còn row trong graph, rows đang trỏ vào nó phải tính lại
+        aliased_ids.append(indexed_id)
+      elif indexed_id:
+        changed_ids.append(indexed_id)
+        total_chunks += chunk_count
+      else:
+        self.document_vector_collection.delete(ids=[document_id])
+        self.document_cache.pop(document_id, None)
+        self.citation_index.remove_document(document_id)
+        removed_ids.append(document_id)
+        
+    self.build_related_documents_graph(changed_ids=changed_ids, removed_ids=removed_ids + aliased_ids)
+    self.citation_index.save()
+    self.duplicate_index.save()
+    
+    return {
+      'documents_updated': len(changed_ids) + len(aliased_ids),
+      'documents_removed': len(removed_ids),
+      'chunks_indexed': total_chunks
+    }
+
+
+
+  def build_related_documents_graph(
+    self,
+    changed_ids: Optional[List[str]] = None,
+    removed_ids: Optional[List[str]] = None
+  ) -> int:
+    """
+    Build related-documents graph từ document vectors:
+      - changed_ids/removed_ids = None: build lại toàn bộ
+      - ngược lại: chỉ cập nhật rows bị ảnh hưởng
+    """
+    
+    vectors = self.document_vector_collection.get(include=['embeddings', 'metadatas'])
+    
+    # Document trùng dùng chung vector với bản canonical, không đưa vào graph
+    rows = [
+      (document_id, embedding)
+      for document_id, embedding, metadata in zip(vectors['ids'], vectors['embeddings'], vectors['metadatas'])
+      if not (metadata or {}).get('duplicate_of')
+    ]
+    document_ids = [document_id for document_id, _ in rows]
+    embeddings = [embedding for _, embedding in rows]
+    
+    if not document_ids:
+      self.related_graph.neighbors = {}
+      self.related_graph.save()
+      return 0
+    
+    if changed_ids is None and removed_ids is None:
+      self.related_graph.build(document_ids, embeddings)
+      rows = len(document_ids)
+    else:
+      rows = self.related_graph.update(
+        document_ids,
+        embeddings,
+        changed_ids=changed_ids or [],
+        removed_ids=removed_ids or []
+      )
+      
+    self.related_graph.save()
+    return rows
+
+
+
+  def get_related_document_ids(self, document_id: str, top_k: int = 5) -> List[Tuple[str, float]]:
+    """Đọc related documents từ graph đã build sẵn"""
+    document_id = self.duplicate_index.document_aliases.get(document_id, document_id)
+    return self.related_graph.get(document_id, top_k)
 
 
 
@@ -210,78 +831,178 @@ class HierarchicalRAGSystem:
     query: str,
     top_k: int = 10,
     folder_filter: Optional[List[str]] = None,
-    legal_category_filter: Optional[str] = None
+    legal_category_filter: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    query_enhancement: Optional[str] = None
   ) -> List[Dict]:
     """
     Hybrid search kết hợp:
-      1. Folder-level semantic search
-      2. Document-level semantic search  
+      1. Folder-level semantic search (beam search theo cây folders)
+      2. Document-level semantic search, chỉ trong các folders đã chọn
       3. Filtering và ranking
+    Khi sắp hết deadline, các stage tùy chọn (query enhancement, over-fetch, re-rank extras)
+    bị bỏ qua và ghi vào deadline.skipped_stages.
     """
     
-    results = []
+    deadline = deadline or Deadline()
+    latencies = self.stage_latencies
     
     # Step 1: Tìm relevant folders trước
-    relevant_folders = self._search_relevant_folders(query, top_k)
+    with latencies.measure('encode'):
+      query_embedding = self.embedding_model.encode([query])
+    with latencies.measure('folder_search'):
+      relevant_folders = self._search_relevant_folders(query, top_k, query_embedding=query_embedding[0])
     
     # Step 2: Search trong documents, ưu tiên relevant folders
     folder_ids = [f['folder_id'] for f in relevant_folders]
     if folder_filter:
-      folder_ids = list(set(folder_ids) & set(folder_filter))
-      
-    # Build where clause cho filtering
-    where_clause = {}
-    if folder_ids:
-      where_clause["folder_id"] = {"$in": folder_ids}
-    if legal_category_filter:
-      where_clause["legal_category"] = legal_category_filter
-      
-    # Enhanced query với folder context
-    enhanced_query = self._enhance_query_with_folder_context(query, relevant_folders)
-    query_embedding = self.embedding_model.encode([enhanced_query])
-    
-    # Search documents
-    doc_results = self.document_collection.query(
-      query_embeddings=[query_embedding[0].tolist()],
-      n_results=top_k * 2, # Lấy nhiều hơn để có thể re-rank
-      where=where_clause if where_clause else None
-    )
+      folder_filter = self._expand_folder_filter(folder_filter)
+      
+      # Intersection rỗng (hoặc chỉ gồm folders cha không có documents) -> dùng folder_filter, không scan toàn bộ corpus
+      matched = [folder_id for folder_id in folder_ids if folder_id in folder_filter]
+      folder_ids = matched if matched and self._route_shards(matched) else list(folder_filter)
+      
+    # Folders có bản trùng được lưu ở folder khác -> search thêm folder chứa bản canonical
+    search_folder_ids = self._with_duplicate_folders(folder_ids)
+    
+    # Chọn shards theo folders và legal category
+    routes = self._route_shards(search_folder_ids, legal_category_filter)
+    if not routes and not folder_filter and legal_category_filter in self.document_shards:
+      # Không folder liên quan nào thuộc category -> search toàn shard của category
+      routes = {legal_category_filter: []}
+    if not routes:
+      return []
+      
+    # Enhanced query với folder context, bỏ qua nếu không đủ thời gian
+    query_enhancement = query_enhancement or self.query_enhancement
+    if query_enhancement == "text":
+      # Encode lại query với text prefix từ folders
+      if deadline.allows('query_enhancement', latencies.estimate('encode', 'document_search', 'hydrate')):
+        enhanced_query = self._enhance_query_with_folder_context(query, relevant_folders)
+        with latencies.measure('encode'):
+          query_embedding = self.embedding_model.encode([enhanced_query])
+    elif query_enhancement == "vector":
+      # Trộn query embedding với folder embeddings đã cache, không encode thêm
+      if deadline.allows('query_enhancement', latencies.estimate('document_search', 'hydrate')):
+        query_embedding = [self._enhance_query_embedding(query_embedding[0], relevant_folders)]
+      
+    # Lấy nhiều hơn để có thể re-rank / diversity filter, bỏ qua nếu không đủ thời gian
+    widen = deadline.allows('diversity_widening', latencies.estimate('document_search', 'document_search', 'hydrate'))
+    n_results = top_k * 2 if widen else top_k
     
-    # Step 3: Re-rank và combine results
-    final_results = self._rerank_results(
-      query, doc_results, relevant_folders
+    # Search documents song song trên các shards
+    with latencies.measure('document_search'):
+      doc_results = self._query_document_shards(
+        routes,
+        query_embedding[0].tolist(),
+        n_results=n_results
+      )
+    
+    if len(search_folder_ids) > len(folder_ids):
+      doc_results = [candidate for candidate in doc_results if self._in_folders(candidate, folder_ids)]
+    
+    # Step 3: Re-rank và combine results trên ids + scores
+    ranked = self._rerank_results(
+      query, doc_results, relevant_folders,
+      extras=deadline.allows('rerank_extras', latencies.estimate('authority_scores', 'duplicate_collapse', 'hydrate')),
+      diversify=widen
     )
     
-    return final_results[:top_k]
+    # Step 4: Chỉ lấy content cho top_k kết quả cuối
+    with latencies.measure('hydrate'):
+      return self._hydrate_candidates(ranked[:top_k])
     
     
   
 
 
-  def _search_relevant_folders(self, query: str, top_k: int = 5) -> List[Dict]:
-    """Tìm folders liên quan đến query"""
+  def _expand_folder_filter(self, folder_filter: List[str]) -> List[str]:
+    """Filter theo một folder bao gồm cả các folders con của nó"""
+    return list(dict.fromkeys(
+      child_id for folder_id in folder_filter for child_id in self.folder_tree.subtree(folder_id)
+    ))
+
+
+  def _with_duplicate_folders(self, folder_ids: List[str]) -> List[str]:
+    """Thêm các folders chứa bản canonical của nội dung trùng trong folder_ids"""
     
-    query_embedding = self.embedding_model.encode([query])
+    expanded = list(folder_ids)
+    for folder_id in folder_ids:
+      for linked_id in self.duplicate_index.folder_links.get(folder_id, []):
+        if linked_id not in expanded:
+          expanded.append(linked_id)
+    return expanded
+
+
+
+  def _in_folders(self, candidate: ChunkCandidate, folder_ids: List[str]) -> bool:
+    """Chunk thuộc folder_ids, trực tiếp hoặc qua một bản trùng"""
     
-    folder_results = self.folder_collection.query(
-      query_embeddings=[query_embedding[0].tolist()],
-      n_results=top_k
+    if candidate.folder_id in folder_ids:
+      return True
+    return any(
+      self.document_cache.get(document_id, {}).get('folder_id') in folder_ids
+      for document_id in self.duplicate_index.alias_documents(candidate.chunk_id)
     )
+
+
+
+  def _search_relevant_folders(self, query: str, top_k: int = 5, query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
+    """
+    Tìm folders liên quan đến query bằng beam search trên cây folders:
+    mỗi tầng giữ top_k subtrees tốt nhất, chỉ đi xuống con của chúng.
+    """
+    
+    if query_embedding is None:
+      query_embedding = self.embedding_model.encode([query])[0]
     
     results = []
     
-    for i in range(len(folder_results['ids'][0])):
+    for folder_id, similarity, subtree_similarity in self.folder_tree.beam_search(query_embedding, beam_width=top_k):
+      folder_meta = self.folder_cache.get(folder_id)
+      if folder_meta is None:
+        continue
+      
       results.append({
-        'folder_id': folder_results['ids'][0][i],
-        'folder_metadata': folder_results['metadatas'][0][i],
-        'similarity_score': 1 - folder_results['distances'][0][i],
-        'description': folder_results['documents'][0][i]
+        'folder_id': folder_id,
+        'folder_metadata': self._folder_metadata_dict(folder_meta),
+        'similarity_score': similarity,
+        'subtree_similarity': subtree_similarity,
+        'description': f"{folder_meta.description} {' '.join(folder_meta.keywords)}"
       })
 
     return results
   
   
   
+  def _enhance_query_embedding(self, query_embedding: np.ndarray, relevant_folders: List[Dict]) -> np.ndarray:
+    """
+    Enhance query trong vector space:
+      query_weight * query + (1 - query_weight) * trung bình folder vectors (weight theo folder similarity)
+    """
+    
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+    
+    folder_vectors = []
+    weights = []
+    for folder in relevant_folders[:self.enhancement_folders]:
+      vector = self.folder_tree.vector(folder['folder_id'])
+      if vector is not None and folder['similarity_score'] > 0:
+        folder_vectors.append(vector)
+        weights.append(folder['similarity_score'])
+        
+    if not weights:
+      return query_vector
+    
+    folder_context = np.average(np.asarray(folder_vectors), axis=0, weights=weights)
+    folder_context = folder_context / (np.linalg.norm(folder_context) or 1.0)
+    
+    enhanced = self.query_weight * query_vector + (1 - self.query_weight) * folder_context
+    return enhanced / (np.linalg.norm(enhanced) or 1.0)
+
+
+
   def _enhance_query_with_folder_context(self, query: str, relevant_folders: List[Dict]) -> str:
     """Enhance query với context từ relevant folders"""
     
@@ -300,53 +1021,228 @@ class HierarchicalRAGSystem:
     return enhanced_query
   
   
+  def compare_query_enhancement(
+    self,
+    queries: List[str],
+    top_k: int = 10,
+    modes: Tuple[str, ...] = QUERY_ENHANCEMENT_MODES,
+    baseline: str = "text"
+  ) -> Dict:
+    """
+    Đo khác biệt giữa các query enhancement modes trên một tập queries:
+    overlap@k của chunk ids so với baseline và latency trung bình của mỗi mode.
+    """
+    
+    per_query = []
+    latencies = {mode: [] for mode in modes}
+    
+    with self._use_generation():
+      # Warm-up để mode chạy đầu tiên không chịu chi phí cold cache
+      if queries:
+        self.hybrid_search(queries[0], top_k=top_k)
+        
+      for query in queries:
+        chunk_ids = {}
+        for mode in modes:
+          started = time.perf_counter()
+          results = self.hybrid_search(query, top_k=top_k, query_enhancement=mode)
+          latencies[mode].append(time.perf_counter() - started)
+          chunk_ids[mode] = [result['chunk_id'] for result in results]
+          
+        per_query.append({
+          'query': query,
+          'results': chunk_ids,
+          # Chia cho số kết quả thực tế (có thể < top_k khi filter hẹp / corpus nhỏ)
+          'overlap_at_k': {
+            mode: len(set(chunk_ids[mode]) & set(chunk_ids[baseline]))
+            / max(1, min(len(chunk_ids[mode]), len(chunk_ids[baseline])))
+            for mode in modes if mode != baseline
+          }
+        })
+        
+    summary = {}
+    for mode in modes:
+      summary[mode] = {'mean_latency_ms': round(1000 * float(np.mean(latencies[mode])), 2) if queries else 0.0}
+      if mode != baseline:
+        summary[mode][f'overlap_at_{top_k}_vs_{baseline}'] = (
+          float(np.mean([item['overlap_at_k'][mode] for item in per_query])) if queries else 0.0
+        )
+        
+    return {
+      'baseline': baseline,
+      'top_k': top_k,
+      'summary': summary,
+      'per_query': per_query
+    }
+  
+  
   def _rerank_results(
     self,
     query: str,
-    doc_results: Dict,
-    folder_results: List[Dict]
-  ) -> List[Dict]:
-    """Re-rank kết quả dựa trên multiple factors"""
-    
-    results = []
+    candidates: List[ChunkCandidate],
+    folder_results: List[Dict],
+    extras: bool = True,
+    diversify: bool = True
+  ) -> List[ChunkCandidate]:
+    """
+    Re-rank kết quả dựa trên multiple factors.
+    Khi sắp hết deadline: extras=False chỉ dùng similarity (bỏ authority score và gộp bản trùng),
+    diversify=False bỏ diversity filter vì không over-fetch thêm candidates.
+    """
     
     # Tạo folder score mapping
     folder_scores = {f['folder_id']: f['similarity_score'] for f in folder_results}
     
-    for i in range(len(doc_results['ids'][0])):
-      metadata = doc_results['metadatas'][0][i]
-      doc_similarity = 1 - doc_results['distances'][0][i]
-      folder_similarity = folder_scores.get(metadata.get('folder_id'), 0)
+    for candidate in candidates:
+      candidate.doc_similarity = 1 - candidate.distance
+      candidate.folder_similarity = folder_scores.get(candidate.folder_id, 0)
       
+    if extras:
+      with self.stage_latencies.measure('authority_scores'):
+        # Authority chỉ phụ thuộc document / folder nên tính một lần mỗi document
+        authority_scores = {}
+        
+        for candidate in candidates:
+          if candidate.document_id not in authority_scores:
+            metadata = self._join_chunk_metadata({
+              'document_id': candidate.document_id,
+              'folder_id': candidate.folder_id
+            })
+            authority_scores[candidate.document_id] = self._calculate_document_authority_score(metadata)
+          candidate.authority_score = authority_scores[candidate.document_id]
       
+    # Bỏ authority score -> chia lại weights cho doc / folder để combined score vẫn cùng thang 0-1
+    weights = (0.7, 0.2, 0.1) if extras else (0.7 / 0.9, 0.2 / 0.9, 0.0)
+    
+    for candidate in candidates:
       # Combined score với weights
-      combined_score = (
-        0.7 * doc_similarity +  # Document relevance
-        0.2 * folder_similarity +  # Folder relevance  
-        0.1 * self._calculate_document_authority_score(metadata)  # Document authority
+      candidate.combined_score = (
+        weights[0] * candidate.doc_similarity +  # Document relevance
+        weights[1] * candidate.folder_similarity +  # Folder relevance  
+        weights[2] * candidate.authority_score  # Document authority
       )
       
-      results.append({
-        'chunk_id': doc_results['ids'][0][i],
-        'content': doc_results['documents'][0][i],
-        'metadata': metadata,
-        'doc_similarity': doc_similarity,
-        'folder_similarity': folder_similarity,
-        'combined_score': combined_score,
-        'authority_score': self._calculate_document_authority_score(metadata)
-      })
-      
     # Sort theo combined score
-    results.sort(key=lambda x: x['combined_score'], reverse=True)
+    candidates.sort(key=lambda candidate: candidate.combined_score, reverse=True)
+    
+    if extras:
+      # Gộp chunks gần trùng, giữ chunk có score cao nhất
+      with self.stage_latencies.measure('duplicate_collapse'):
+        candidates = self._collapse_duplicates(candidates)
+    
+    if not diversify:
+      return candidates
     
     # Diversity filtering - tránh quá nhiều chunks từ cùng document
-    diverse_results = self._apply_diversity_filter(results)
+    diverse_results = self._apply_diversity_filter(candidates)
     
     return diverse_results
     
   
   
   
+  def _join_chunk_metadata(self, chunk_metadata: Dict) -> Dict:
+    """Join metadata gọn của chunk với document table và folder table trong memory"""
+    
+    metadata = dict(chunk_metadata)
+    
+    document_meta = self.document_cache.get(metadata.get('document_id'))
+    if document_meta:
+      metadata.update({
+        'file_name': document_meta.get('file_name', ''),
+        'file_type': document_meta.get('file_type', ''),
+        'total_chunks': document_meta.get('total_chunks', 0)
+      })
+      
+    folder_meta = self.folder_cache.get(metadata.get('folder_id'))
+    if folder_meta:
+      metadata.update({
+        'folder_path': folder_meta.folder_path,
+        'folder_name': folder_meta.folder_name,
+        'folder_meta_summary': folder_meta.description,
+        'legal_category': folder_meta.legal_domain,
+        'folder_keywords': ", ".join(folder_meta.keywords)
+      })
+      
+    return metadata
+
+
+
+  def refresh_folder_metadata(self, folder_id: str) -> Optional[FolderMetadata]:
+    """
+    Load lại meta.json của một folder sau khi chỉnh sửa.
+    Chỉ cập nhật một row trong folder table, không embed lại chunk records:
+    ghi tuần tự dưới _rebuild_lock, FolderMetadata và folder tree mới chỉ được swap vào sau khi đã persist.
+    Đổi legal_domain: chunks của folder được copy (kèm vectors) sang shard mới trước khi swap, rồi mới xóa ở shard cũ,
+    nên search luôn route tới một shard có đủ chunks.
+    Lưu ý: chunk vectors vẫn mang folder context cũ (_create_enhanced_chunk_text); muốn embed lại theo
+    description / keywords mới thì gọi update_documents với các files của folder.
+    """
+    
+    with self._rebuild_lock:
+      folder_meta = self.folder_cache.get(folder_id)
+      if folder_meta is None:
+        return None
+      
+      meta_data = self.processor.load_folder_metadata(folder_meta.folder_path)
+      if not meta_data:
+        return folder_meta
+      
+      refreshed = replace(
+        folder_meta,
+        description=meta_data.get('description', ''),
+        legal_domain=meta_data.get('legal_domain', ''),
+        last_updated=meta_data.get('last_updated', ''),
+        keywords=meta_data.get('keywords', []),
+        parent_folder=meta_data.get('parent_folder')
+      )
+      
+      folder_text = f"{refreshed.description} {' '.join(refreshed.keywords)}"
+      folder_embedding = self.embedding_model.encode([folder_text])
+      
+      self.folder_collection.upsert(
+        embeddings=[folder_embedding[0].tolist()],
+        documents=[folder_text],
+        metadatas=[self._folder_metadata_dict(refreshed)],
+        ids=[folder_id]
+      )
+      
+      old_shard = self.document_shards.get(folder_meta.legal_domain)
+      moved = refreshed.legal_domain != folder_meta.legal_domain and old_shard is not None
+      if moved:
+        moved_count = self._copy_folder_chunks(folder_id, old_shard, self._get_document_shard(refreshed.legal_domain))
+        
+      self.folder_cache[folder_id] = refreshed
+      
+      if moved:
+        old_shard.delete(where={"folder_id": folder_id})
+        print(f"#####===> Moved {moved_count} chunks of folder {refreshed.folder_name} to shard {refreshed.legal_domain}")
+        
+      # Vector của folder đổi -> tính lại summary vectors của các folders cha
+      self.build_folder_tree()
+      return refreshed
+
+
+
+  def _copy_folder_chunks(self, folder_id: str, source, target, batch_size: int = 1000) -> int:
+    """Copy chunk records (text, metadata, vectors) của một folder sang shard khác, không embed lại"""
+    
+    records = source.get(where={"folder_id": folder_id}, include=['embeddings', 'documents', 'metadatas'])
+    ids = records['ids']
+    
+    for start in range(0, len(ids), batch_size):
+      end = start + batch_size
+      target.upsert(
+        ids=ids[start:end],
+        embeddings=[list(embedding) for embedding in records['embeddings'][start:end]],
+        documents=records['documents'][start:end],
+        metadatas=records['metadatas'][start:end]
+      )
+      
+    return len(ids)
+
+
+
   def _calculate_document_authority_score(self, metadata: Dict) -> float:
     """Tính authority score dựa trên metadata"""
     score = 0.5  # Base score
@@ -368,13 +1264,32 @@ class HierarchicalRAGSystem:
 
 
 
-  def _apply_diversity_filter(self, results: List[Dict], max_per_doc: int = 3) -> List[Dict]:
+  def _collapse_duplicates(self, results: List[ChunkCandidate]) -> List[ChunkCandidate]:
+    """
+    Gộp các chunks cùng nội dung (exact hash sau chuẩn hóa), chunk bị gộp ghi vào duplicate_ids.
+    Chunks chỉ gần trùng không gộp: khác biệt nhỏ thường là nội dung sửa đổi.
+    """
+    kept = []
+    
+    for result in results:
+      for existing in kept:
+        if self.duplicate_index.same_content(existing.chunk_id, result.chunk_id):
+          existing.duplicate_ids.append(result.chunk_id)
+          break
+      else:
+        kept.append(result)
+        
+    return kept
+
+
+
+  def _apply_diversity_filter(self, results: List[ChunkCandidate], max_per_doc: int = 3) -> List[ChunkCandidate]:
     """Áp dụng diversity filtering"""
     doc_counts = {}
     filtered_results = []
     
     for result in results:
-      doc_id = result['metadata']['document_id']
+      doc_id = result.document_id
       count = doc_counts.get(doc_id, 0)
       
       if count < max_per_doc:
@@ -391,57 +1306,294 @@ class HierarchicalRAGSystem:
     if folder_id in self.folder_cache:
       folder_meta = self.folder_cache[folder_id]
       
+      shard = self._shard_for_folder(folder_id)
+      if shard is None:
+        return {
+          'folder_metadata': asdict(folder_meta),
+          'sample_documents': {},
+          'total_chunks': 0
+        }
+      
       # Lấy sample documents từ folder
-      sample_docs = self.document_collection.query(
-        query_embeddings=None,
-        n_results=5,
+      sample_docs = shard.get(
         where={
           "folder_id": folder_id
-        }
+        },
+        limit=5,
+        include=['documents', 'metadatas']
       )
       
       return {
         'folder_metadata': asdict(folder_meta),
         'sample_documents': sample_docs,
-        'total_chunks': len(sample_docs['ids'][0]) if sample_docs['ids'] else 0
+        'total_chunks': len(sample_docs['ids'])
       }
 
     return {}
 
   
   
-  def build_index(self, force_rebuild: bool = False):
-    """Main method để build toàn bộ index"""
+  def build_index(
+    self,
+    force_rebuild: bool = False,
+    background: bool = False,
+    validation_queries: Optional[List[str]] = None
+  ):
+    """
+    Main method để build toàn bộ index.
+    Index được build vào một generation mới, validate, rồi mới switch readers sang;
+    background=True chạy build trong thread riêng, search vẫn dùng generation cũ.
+    """
+    
+    # DB cũ chưa shard: không có document vectors / shards -> phải build lại
+    if not force_rebuild and self.active_index.has_legacy_chunks():
+      print("Found legacy unsharded document_chunks collection, rebuilding index...")
+      force_rebuild = True
     
     # Check if data already exists
     if not force_rebuild and self.folder_cache:
       print("Database already exists. Use force_rebuild=True to rebuild.")
       return {
         'folders_indexed': len(self.folder_cache),
-        'chunks_indexed': self.document_collection.count(),
+        'chunks_indexed': self._count_document_chunks(),
+        'generation': self.active_index.generation,
         'status': 'loaded_existing'
       }
     
-    print("---> Indexing folders...")
-    folder_count = len(self.index_folders())
-    print(f"#####===> Indexed {folder_count} folders")
+    generation_number = self._allocate_generation()
+    
+    if background:
+      thread = threading.Thread(
+        target=self._build_generation,
+        args=(generation_number, validation_queries),
+        daemon=True
+      )
+      thread.start()
+      return {
+        'generation': generation_number,
+        'status': 'building'
+      }
+      
+    return self._build_generation(generation_number, validation_queries)
+
+
+
+  def _build_generation(self, generation_number: int, validation_queries: Optional[List[str]] = None) -> Dict:
+    """Build generation mới, validate và switch nếu hợp lệ"""
+    
+    with self._rebuild_lock:
+      generation = IndexGeneration(generation_number, self.chroma_client, self.persist_directory)
+      
+      # Dọn dữ liệu còn sót nếu lần build trước của generation này bị crash
+      generation.reset()
+      
+      with self._use_generation(generation):
+        print(f"---> Building index generation {generation.generation}")
+        
+        print("---> Indexing folders...")
+        folder_count = len(self.index_folders())
+        print(f"#####===> Indexed {folder_count} folders")
+        
+        root_count = self.build_folder_tree()
+        print(f"#####===> Built folder tree with {root_count} top-level folders")
+        
+        print("---> Indexing documents...")
+        chunk_count = self.index_documents()
+        print(f"#####===> Indexed {chunk_count} document chunks")
+        
+        self.citation_index.save()
+        print(f"#####===> Indexed citations for {len(self.citation_index.documents)} documents")
+        
+        self.duplicate_index.save()
+        print(f"#####===> Skipped {len(self.duplicate_index.chunk_aliases)} duplicate chunks, {len(self.duplicate_index.document_aliases)} duplicate documents")
+        
+        print("---> Building related documents graph...")
+        self.build_related_documents_graph()
+        print(f"#####===> Linked {len(self.related_graph.neighbors)} documents")
+        
+        validation = self._validate_generation(validation_queries)
+        
+      stats = {
+        'folders_indexed': folder_count,
+        'chunks_indexed': chunk_count,
+        'generation': generation.generation
+      }
+      
+      if not validation['passed']:
+        print(f"❌ Generation {generation.generation} failed validation: {validation['errors']}")
+        generation.drop()
+        return {**stats, 'validation': validation, 'status': 'validation_failed'}
+      
+      self._activate_generation(generation, stats)
+      print(f"#####===> Switched to index generation {generation.generation}")
+      
+      return {**stats, 'validation': validation, 'status': 'newly_built'}
+
+
+
+  def _validate_generation(self, validation_queries: Optional[List[str]] = None) -> Dict:
+    """Validate generation đang được pin: counts và sample queries"""
+    
+    errors = []
     
-    print("---> Indexing documents...")
-    chunk_count = self.index_documents()
-    print(f"#####===> Indexed {chunk_count} document chunks")
+    folder_count = self.folder_collection.count()
+    chunk_count = self._count_document_chunks()
+    document_count = self.document_vector_collection.count()
     
+    if folder_count == 0:
+      errors.append("no folders indexed")
+    if chunk_count == 0:
+      errors.append("no chunks indexed")
+    if document_count == 0:
+      errors.append("no document vectors indexed")
+      
+    # Không chấp nhận generation mới mất quá nhiều chunks so với generation active
+    active_chunks = self.active_index.count_chunks()
+    if active_chunks and chunk_count < self.min_chunk_ratio * active_chunks:
+      errors.append(f"chunk count dropped from {active_chunks} to {chunk_count}")
+      
+    # Sample queries: mặc định dùng description của vài folders
+    if validation_queries is None:
+      validation_queries = [meta.description for meta in list(self.folder_cache.values())[:3] if meta.description]
+      
+    if not errors:
+      for query in validation_queries:
+        if not self.hybrid_search(query, top_k=3):
+          errors.append(f"no results for sample query: {query}")
+          
     return {
-      'folders_indexed': folder_count,
-      'chunks_indexed': chunk_count,
-      'status': 'newly_built'
+      'passed': not errors,
+      'errors': errors,
+      'folders': folder_count,
+      'chunks': chunk_count,
+      'documents': document_count,
+      'sample_queries': len(validation_queries)
     }
+
+
+
+  def _activate_generation(self, generation: IndexGeneration, stats: Optional[Dict] = None):
+    """Switch readers sang generation (atomic) và dọn generations cũ"""
+    
+    previous = self.active_index
+    self.manifest.activate(generation.generation, stats)
+    with self._readers_lock:
+      self.active_index = generation
+    
+    # Generation cũ rỗng (vd. DB mới tạo) không cần giữ để rollback
+    if previous.generation != generation.generation and previous.count_chunks() == 0:
+      self.manifest.remove(previous.generation)
+      self._retire_generation(previous)
+      
+    # Giữ keep_generations generations mới nhất để rollback; search đang đọc generation cũ vẫn chạy xong rồi mới drop
+    for old_generation in self.manifest.retained()[self.keep_generations:]:
+      self.manifest.remove(old_generation)
+      self._retire_generation(
+        previous if old_generation == previous.generation
+        else IndexGeneration(old_generation, self.chroma_client, self.persist_directory)
+      )
+
+
+
+  def _model_info(self) -> Dict:
+    """Embedding model dùng để build index (ghi vào snapshot)"""
+    return {
+      'name': self.embedding_model_name,
+      'dimension': self.embedding_model.get_sentence_embedding_dimension(),
+      'library_version': getattr(sentence_transformers, '__version__', None),
+      'revision': self._model_revision()
+    }
+
+
+  def _model_revision(self) -> Optional[str]:
+    """Commit hash của model trên Hugging Face Hub, None nếu không xác định được (vd. model local)"""
+    try:
+      return self.embedding_model[0].auto_model.config._commit_hash
+    except Exception:
+      model_card = getattr(self.embedding_model, 'model_card_data', None)
+      return getattr(model_card, 'base_model_revision', None)
+
+
+
+  def export_snapshot(self, path: str, vector_dtype: str = "float16") -> Dict:
+    """Export generation đang active ra một file snapshot để node khác import"""
+    
+    generation = self.index
+    with self._use_generation(generation):
+      return export_snapshot(generation, path, self._model_info(), vector_dtype)
+
+
+
+  def import_snapshot(self, path: str, validation_queries: Optional[List[str]] = None) -> Dict:
+    """
+    Import snapshot vào một generation mới (không extract / embed lại documents),
+    validate rồi switch readers giống build_index.
+    """
+    
+    manifest = read_snapshot_manifest(path)
+    check_model_compatibility(manifest, self._model_info())
+    
+    generation_number = self._allocate_generation()
+    
+    with self._rebuild_lock:
+      generation = IndexGeneration(generation_number, self.chroma_client, self.persist_directory)
+      generation.reset()
+      
+      print(f"---> Importing snapshot {path} into index generation {generation.generation}")
+      loaded = load_snapshot(generation, path)
+      
+      # Mở lại để load caches, graph, citations từ dữ liệu vừa import
+      generation = self._open_generation(generation.generation)
+      with self._use_generation(generation):
+        validation = self._validate_generation(validation_queries)
+        
+      stats = {
+        'folders_indexed': len(generation.folder_cache),
+        'chunks_indexed': generation.count_chunks(),
+        'generation': generation.generation,
+        'snapshot': os.path.basename(path)
+      }
+      
+      if not validation['passed']:
+        print(f"❌ Snapshot generation {generation.generation} failed validation: {validation['errors']}")
+        generation.drop()
+        return {**stats, 'validation': validation, 'status': 'validation_failed'}
+      
+      self._activate_generation(generation, stats)
+      print(f"#####===> Switched to index generation {generation.generation}")
+      
+      return {**stats, 'records': loaded['counts'], 'validation': validation, 'status': 'imported'}
+
+
+
+  def rollback(self, generation: Optional[int] = None) -> Dict:
+    """Switch về một generation cũ đã giữ lại (mặc định: generation gần nhất)"""
+    
+    with self._rebuild_lock:
+      retained = self.manifest.retained()
+      if generation is None:
+        if not retained:
+          raise ValueError("No retained index generation to roll back to")
+        generation = retained[0]
+      elif generation not in retained:
+        raise ValueError(f"Index generation {generation} is not available for rollback")
+        
+      previous = self.active_index.generation
+      self._activate_generation(self._open_generation(generation))
+      print(f"#####===> Rolled back index generation {previous} -> {generation}")
+      
+      return {
+        'previous_generation': previous,
+        'generation': generation,
+        'status': 'rolled_back'
+      }
     
     
   def has_existing_data(self) -> bool:
     """Check if database already has data"""
     try:
-      folder_count = len(self.folder_collection.get()['ids'])
-      doc_count = len(self.document_collection.get()['ids'])
+      folder_count = self.folder_collection.count()
+      doc_count = self._count_document_chunks()
       return folder_count > 0 and doc_count > 0
     except:
       return False
@@ -452,16 +1604,52 @@ class HierarchicalRAGSystem:
     query: str,
     top_k: int = 5,
     include_folder_context: bool = True,
+    use_citation_index: bool = True,
+    deadline: Union[Deadline, float, None] = None,
+    **filters
+  ) -> Dict:
+    """
+    Main search interface.
+    deadline: Deadline hoặc budget (giây); khi sắp hết hạn các stage tùy chọn bị bỏ qua
+    và được liệt kê trong 'skipped_stages' của response.
+    """
+    
+    deadline = Deadline.coerce(deadline)
+    
+    # Pin generation để cả search đọc cùng một index, kể cả khi đang switch
+    with self._use_generation():
+      response = self._search(query, top_k, include_folder_context, use_citation_index, deadline, **filters)
+      
+    response['skipped_stages'] = deadline.skipped_stages
+    response['deadline_exceeded'] = deadline.expired()
+    return response
+
+
+
+  def _search(
+    self,
+    query: str,
+    top_k: int,
+    include_folder_context: bool,
+    use_citation_index: bool,
+    deadline: Deadline,
     **filters
   ) -> Dict:
-    """Main search interface"""
+    """Search trên generation đã được pin"""
+    
+    # Query trích dẫn cụ thể (vd. "Điều 5 Nghị định 209/2013/NĐ-CP") -> trả lời thẳng, không cần embedding
+    if use_citation_index:
+      citation_results = self._search_citations(query, top_k, include_folder_context, **filters)
+      if citation_results['results']:
+        return citation_results
     
     # Perform hybrid search
     results = self.hybrid_search(
       query=query,
       top_k=top_k,
       folder_filter=filters.get('folder_filter'),
-      legal_category_filter=filters.get('legal_category_filter')
+      legal_category_filter=filters.get('legal_category_filter'),
+      deadline=deadline
     )
     
     # Format results
@@ -475,7 +1663,8 @@ class HierarchicalRAGSystem:
           'folder': result['metadata']['folder_name'],
           'file': result['metadata']['file_name'],
           'chunk_position': f"{result['metadata']['chunk_index'] + 1}/{result['metadata']['total_chunks']}"
-        }
+        },
+        'duplicate_sources': result['duplicate_sources']
       }
 
       if include_folder_context:
@@ -489,7 +1678,85 @@ class HierarchicalRAGSystem:
     return {
       'query': query,
       'results': formatted_results,
-      'total_results': len(formatted_results)
+      'total_results': len(formatted_results),
+      'match_type': 'semantic'
+    }
+
+
+
+  def _search_citations(
+    self,
+    query: str,
+    top_k: int,
+    include_folder_context: bool,
+    **filters
+  ) -> Dict:
+    """Lookup trích dẫn trong structural index, format giống kết quả search"""
+    
+    folder_filter = filters.get('folder_filter')
+    if folder_filter:
+      folder_filter = set(self._expand_folder_filter(folder_filter))
+    legal_category_filter = filters.get('legal_category_filter')
+    
+    formatted_results = []
+    by_provision = {}
+    for hit in self.citation_index.lookup(query):
+      metadata = self._join_chunk_metadata({
+        'document_id': hit['document_id'],
+        'folder_id': self.document_cache.get(hit['document_id'], {}).get('folder_id', '')
+      })
+      
+      if folder_filter and metadata['folder_id'] not in folder_filter:
+        continue
+      if legal_category_filter and metadata.get('legal_category') != legal_category_filter:
+        continue
+      
+      # Cùng provision trong document trùng -> một kết quả, giữ document kia làm nguồn phụ
+      canonical_document = self.duplicate_index.document_aliases.get(hit['document_id'], hit['document_id'])
+      provision_key = (canonical_document, normalize_document_number(hit['citation']))
+      if provision_key in by_provision:
+        by_provision[provision_key]['duplicate_sources'].append({
+          'document_id': hit['document_id'],
+          'folder': metadata.get('folder_name', ''),
+          'file': metadata.get('file_name', '')
+        })
+        continue
+      
+      metadata.update({
+        'citation': hit['citation'],
+        'start_char': hit['span'][0],
+        'end_char': hit['span'][1]
+      })
+      
+      formatted_result = {
+        'content': hit['text'],
+        'metadata': metadata,
+        'relevance_score': 1.0,
+        'source_info': {
+          'folder': metadata.get('folder_name', ''),
+          'file': metadata.get('file_name', ''),
+          'chunk_position': hit['citation']
+        },
+        'neighbors': hit['neighbors'],
+        'duplicate_sources': []
+      }
+      by_provision[provision_key] = formatted_result
+      
+      if include_folder_context:
+        formatted_result['folder_context'] = {
+          'domain': metadata.get('legal_category', ''),
+          'description': metadata.get('folder_meta_summary', '')
+        }
+        
+      formatted_results.append(formatted_result)
+      
+    formatted_results = formatted_results[:top_k]
+    
+    return {
+      'query': query,
+      'results': formatted_results,
+      'total_results': len(formatted_results),
+      'match_type': 'citation'
     }
     
     
@@ -531,21 +1798,39 @@ class HierarchicalRAGSystem:
       print(f"No existing data found or error loading: {e}")
       
   
+  def _load_existing_document_cache(self):
+    """Load document cache từ document vector collection"""
+    try:
+      existing_documents = self.document_vector_collection.get(include=['metadatas'])
+      
+      for document_id, metadata in zip(existing_documents['ids'], existing_documents['metadatas']):
+        self.document_cache[document_id] = metadata
+        
+    except Exception as e:
+      print(f"No existing document data found or error loading: {e}")
+      
+  
   def debug_document_content(self, document_id: str = None, limit: int = 3):
     """Debug để xem nội dung chunks"""
     
-    if document_id:
-      # Get specific document chunks
-      results = self.document_collection.get(
-        where={"document_id": document_id},
-        include=['documents', 'metadatas']
-      )
-    else:
-      # Get random sample
-      results = self.document_collection.get(
-        limit=limit,
-        include=['documents', 'metadatas']
-      )
+    results = {'ids': [], 'documents': [], 'metadatas': []}
+    
+    for shard in self.document_shards.values():
+      if document_id:
+        # Get specific document chunks
+        shard_results = shard.get(
+          where={"document_id": document_id},
+          include=['documents', 'metadatas']
+        )
+      else:
+        # Get random sample
+        shard_results = shard.get(
+          limit=limit,
+          include=['documents', 'metadatas']
+        )
+        
+      for key in results:
+        results[key].extend(shard_results[key])
     
     print(f"\n=== DEBUG: Document chunks ===")
     if not results['ids']:
@@ -559,7 +1844,7 @@ class HierarchicalRAGSystem:
     )):
       print(f"\nChunk {i+1}: {chunk_id}")
       print(f"Length: {len(content)} chars")
-      print(f"File: {metadata['file_name']}")
+      print(f"File: {self._join_chunk_metadata(metadata).get('file_name', '')}")
       print(f"Content preview: {content[:500]}...")
       print("-" * 50)
       
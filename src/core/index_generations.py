@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import time
+from typing import List, Dict, Optional
+from core.related_document_graph import RelatedDocumentGraph
+from core.citation_index import CitationIndex
+from core.near_duplicates import DuplicateIndex
+from core.folder_tree import FolderTree
+
+
+class IndexGeneration:
+  """
+  Một phiên bản (generation) của index: collections, caches và side files.
+  Generation 0 dùng tên collection cũ (trước khi có generations).
+  """
+
+  SHARD_PREFIX = "document_chunks_"
+  
+  # Collection chunks duy nhất của DB cũ (trước khi shard theo legal_domain)
+  LEGACY_CHUNK_COLLECTION = "document_chunks"
+
+  def __init__(self, generation: int, chroma_client, persist_directory: str):
+    self.generation = generation
+    self.chroma_client = chroma_client
+    self.persist_directory = persist_directory
+    self._open()
+
+
+  def _open(self):
+    """Tạo / lấy collections và khởi tạo caches rỗng"""
+
+    # Collection cho different levels
+    self.folder_collection = self._get_or_create_collection(self.collection_name("folder_metadata"))
+    self.document_vector_collection = self._get_or_create_collection(self.collection_name("document_vectors"))
+
+    # Document chunks được shard theo legal_domain (legal_domain -> collection)
+    self.document_shards = {}
+
+    # Cache cho folder metadata và document-level metadata
+    self.folder_cache = {}
+    self.document_cache = {}
+
+    # Cây folders với summary vectors cho beam search
+    self.folder_tree = FolderTree(self.file_path("folder_tree.json"))
+    
+    # Related-documents graph, build từ document vectors lúc index
+    self.related_graph = RelatedDocumentGraph(self.file_path("related_documents.json"))
+
+    # Structural citation index (số hiệu văn bản, Điều / Khoản / Điểm)
+    self.citation_index = CitationIndex(self.file_path("citations.json"))
+    
+    # Fingerprints chunks / documents để không embed lại bản trùng
+    self.duplicate_index = DuplicateIndex(self.file_path("duplicates.json"))
+
+
+  def collection_name(self, base_name: str) -> str:
+    """Tên collection của generation này"""
+    return base_name if self.generation == 0 else f"{base_name}_g{self.generation}"
+
+
+  def file_path(self, file_name: str) -> str:
+    """Đường dẫn side file (graph, ...) của generation này"""
+    if self.generation == 0:
+      return os.path.join(self.persist_directory, file_name)
+    stem, ext = os.path.splitext(file_name)
+    return os.path.join(self.persist_directory, f"{stem}_g{self.generation}{ext}")
+
+
+  def _get_or_create_collection(self, name: str, metadata: Optional[Dict] = None):
+    """Tạo hoặc lấy collection từ ChromaDB"""
+    return self.chroma_client.get_or_create_collection(
+      name=name,
+      metadata={"hnsw:space": "cosine", **(metadata or {})}
+    )
+
+
+  def shard_collection_name(self, legal_domain: str) -> str:
+    """Tên collection cho shard của một legal_domain"""
+    return f"{self.collection_name('document_chunks')}_{hashlib.md5(legal_domain.encode()).hexdigest()[:12]}"
+
+
+  def get_or_create_shard(self, legal_domain: str):
+    """Lấy hoặc tạo shard collection cho legal_domain"""
+
+    if legal_domain not in self.document_shards:
+      self.document_shards[legal_domain] = self._get_or_create_collection(
+        self.shard_collection_name(legal_domain),
+        {"shard_domain": legal_domain, "generation": self.generation}
+      )
+    return self.document_shards[legal_domain]
+
+
+  def _own_collection_names(self) -> List[str]:
+    """Tên tất cả collections đang có trong DB thuộc generation này"""
+
+    names = []
+    for collection in self.chroma_client.list_collections():
+      # Chroma mới trả về tên, bản cũ trả về Collection object
+      name = collection if isinstance(collection, str) else collection.name
+
+      if name in (self.collection_name("folder_metadata"), self.collection_name("document_vectors")):
+        names.append(name)
+      elif name == self.LEGACY_CHUNK_COLLECTION and self.generation == 0:
+        names.append(name)
+      elif name.startswith(self.SHARD_PREFIX):
+        shard = self.chroma_client.get_collection(name)
+        if int((shard.metadata or {}).get("generation", 0)) == self.generation:
+          names.append(name)
+
+    return names
+
+
+  def load_shards(self):
+    """Load các shard collections đã có trong DB"""
+
+    for name in self._own_collection_names():
+      if not name.startswith(self.SHARD_PREFIX):
+        continue
+
+      shard = self.chroma_client.get_collection(name)
+      legal_domain = (shard.metadata or {}).get("shard_domain")
+      if legal_domain is not None:
+        self.document_shards[legal_domain] = shard
+
+
+  def has_legacy_chunks(self) -> bool:
+    """DB cũ: chunks nằm trong collection document_chunks chưa shard, search trên shards sẽ không thấy"""
+    
+    if self.document_shards:
+      return False
+    return self.LEGACY_CHUNK_COLLECTION in self._own_collection_names()
+
+
+  def count_chunks(self) -> int:
+    """Tổng số chunks trên tất cả shards"""
+    return sum(shard.count() for shard in self.document_shards.values())
+
+
+  def drop(self):
+    """Xóa toàn bộ collections và side files của generation"""
+
+    for name in self._own_collection_names():
+      self.chroma_client.delete_collection(name)
+
+    for path in (self.folder_tree.path, self.related_graph.path, self.citation_index.path, self.duplicate_index.path):
+      if os.path.exists(path):
+        os.remove(path)
+
+
+  def reset(self):
+    """Xóa dữ liệu còn sót (vd. rebuild bị crash) rồi tạo lại collections rỗng"""
+    self.drop()
+    self._open()
+
+
+
+class IndexManifest:
+  """File manifest ghi generation đang active và các generations giữ lại để rollback"""
+
+  def __init__(self, path: str):
+    self.path = path
+    self.active: Optional[int] = None
+    self.generations: Dict[int, Dict] = {}
+
+
+  def load(self) -> bool:
+    """Load manifest, trả về False nếu chưa có"""
+
+    if not os.path.exists(self.path):
+      return False
+
+    try:
+      with open(self.path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+      self.active = data.get('active')
+      self.generations = {int(gen): info for gen, info in data.get('generations', {}).items()}
+      return True
+    except Exception as e:
+      print(f"Error loading index manifest from {self.path}: {e}")
+      return False
+
+
+  def save(self):
+    """Ghi file tạm rồi os.replace để switch là atomic"""
+
+    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+    tmp_path = f"{self.path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      json.dump({
+        'active': self.active,
+        'generations': {str(gen): info for gen, info in self.generations.items()}
+      }, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, self.path)
+
+
+  def next_generation(self) -> int:
+    """Số generation cho lần build tiếp theo"""
+    return max([self.active or 0, *self.generations.keys()]) + 1
+
+
+  def activate(self, generation: int, stats: Optional[Dict] = None):
+    """Đánh dấu generation là active và persist"""
+
+    if self.active is not None and self.active not in self.generations:
+      self.generations[self.active] = {'created_at': None}
+
+    info = self.generations.setdefault(generation, {'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')})
+    if stats:
+      info.update(stats)
+
+    self.active = generation
+    self.save()
+
+
+  def retained(self) -> List[int]:
+    """Generations không active, mới nhất trước"""
+    return sorted((gen for gen in self.generations if gen != self.active), reverse=True)
+
+
+  def remove(self, generation: int):
+    self.generations.pop(generation, None)
+    self.save()
@@ -0,0 +1,268 @@
+import argparse
+import io
+import json
+import os
+import time
+import zipfile
+import numpy as np
+from typing import List, Dict, Any, Tuple
+from core.index_generations import IndexGeneration
+
+
+SNAPSHOT_FORMAT_VERSION = 1
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+
+class SnapshotError(ValueError):
+  """Snapshot không hợp lệ hoặc không tương thích với system hiện tại"""
+
+
+def quantize_vectors(vectors: np.ndarray, vector_dtype: str) -> Dict[str, np.ndarray]:
+  """
+  Nén vectors để ghi vào snapshot:
+    - float16: cast trực tiếp
+    - int8: symmetric per-row scale, vector = q * scale
+  """
+
+  vectors = np.asarray(vectors, dtype=np.float32)
+
+  if vector_dtype == "int8":
+    scales = np.abs(vectors).max(axis=1, keepdims=True) / 127.0
+    scales[scales == 0] = 1.0
+    return {
+      'vectors': np.round(vectors / scales).astype(np.int8),
+      'scales': scales.astype(np.float32)
+    }
+
+  return {'vectors': vectors.astype(vector_dtype)}
+
+
+def dequantize_vectors(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+  """Khôi phục float32 vectors từ arrays trong snapshot"""
+
+  vectors = arrays['vectors'].astype(np.float32)
+  if 'scales' in arrays:
+    vectors *= arrays['scales']
+  return vectors
+
+
+def _write_array(archive: zipfile.ZipFile, name: str, array: np.ndarray):
+  buffer = io.BytesIO()
+  np.save(buffer, array, allow_pickle=False)
+  archive.writestr(name, buffer.getvalue())
+
+
+def _read_array(archive: zipfile.ZipFile, name: str) -> np.ndarray:
+  return np.load(io.BytesIO(archive.read(name)), allow_pickle=False)
+
+
+def _write_json(archive: zipfile.ZipFile, name: str, data: Any):
+  archive.writestr(name, json.dumps(data, ensure_ascii=False))
+
+
+def _snapshot_collections(generation: IndexGeneration) -> List[Tuple[Dict, Any]]:
+  """Các collections của generation: (entry ghi trong manifest, collection)"""
+
+  entries = [
+    ({'kind': 'folder_metadata', 'path': 'collections/folder_metadata'}, generation.folder_collection),
+    ({'kind': 'document_vectors', 'path': 'collections/document_vectors'}, generation.document_vector_collection)
+  ]
+  for legal_domain, shard in sorted(generation.document_shards.items()):
+    shard_name = generation.shard_collection_name(legal_domain)[-12:]
+    entries.append((
+      {'kind': 'document_shard', 'legal_domain': legal_domain, 'path': f'collections/shard_{shard_name}'},
+      shard
+    ))
+  return entries
+
+
+def _side_files(generation: IndexGeneration) -> Dict[str, str]:
+  """Side files của generation: tên trong snapshot -> đường dẫn"""
+  return {
+    'folder_tree.json': generation.folder_tree.path,
+    'related_documents.json': generation.related_graph.path,
+    'citations.json': generation.citation_index.path,
+    'duplicates.json': generation.duplicate_index.path
+  }
+
+
+def export_snapshot(
+  generation: IndexGeneration,
+  path: str,
+  model_info: Dict,
+  vector_dtype: str = "float16"
+) -> Dict:
+  """
+  Ghi toàn bộ một generation ra một file snapshot (zip):
+    manifest.json, vectors (float16/int8) + texts + metadata của từng collection, side files.
+  """
+
+  if vector_dtype not in VECTOR_DTYPES:
+    raise SnapshotError(f"Unsupported vector dtype: {vector_dtype}")
+
+  manifest = {
+    'format_version': SNAPSHOT_FORMAT_VERSION,
+    'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'source_generation': generation.generation,
+    'embedding_model': model_info,
+    'vector_dtype': vector_dtype,
+    'collections': [],
+    'side_files': []
+  }
+
+  os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+  tmp_path = f"{path}.tmp"
+
+  with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+    for entry, collection in _snapshot_collections(generation):
+      records = collection.get(include=['embeddings', 'documents', 'metadatas'])
+
+      if len(records['ids']):
+        arrays = quantize_vectors(records['embeddings'], vector_dtype)
+      else:
+        arrays = {'vectors': np.zeros((0, model_info.get('dimension') or 0), dtype=vector_dtype)}
+      for name, array in arrays.items():
+        _write_array(archive, f"{entry['path']}/{name}.npy", array)
+
+      _write_json(archive, f"{entry['path']}/records.json", {
+        'ids': records['ids'],
+        'documents': records['documents'],
+        'metadatas': records['metadatas']
+      })
+
+      manifest['collections'].append({**entry, 'count': len(records['ids'])})
+
+    for name, side_path in _side_files(generation).items():
+      if os.path.exists(side_path):
+        archive.write(side_path, f"side_files/{name}")
+        manifest['side_files'].append(name)
+
+    _write_json(archive, "manifest.json", manifest)
+
+  os.replace(tmp_path, path)
+  return manifest
+
+
+def read_snapshot_manifest(path: str) -> Dict:
+  """Đọc manifest của snapshot, kiểm tra format version"""
+
+  with zipfile.ZipFile(path, 'r') as archive:
+    manifest = json.loads(archive.read("manifest.json"))
+
+  if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+    raise SnapshotError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+  return manifest
+
+
+def _major_minor(version: str) -> Tuple[str, ...]:
+  return tuple(version.split(".")[:2])
+
+
+def check_model_compatibility(manifest: Dict, model_info: Dict):
+  """
+  Từ chối snapshot build bằng embedding model khác:
+  cùng name + dimension, cùng revision của model và cùng major.minor version của sentence-transformers
+  (chỉ so sánh khi cả hai bên đều ghi nhận được).
+  """
+
+  snapshot_model = manifest.get('embedding_model', {})
+  for key in ('name', 'dimension'):
+    if snapshot_model.get(key) != model_info.get(key):
+      raise SnapshotError(
+        f"Snapshot was built with embedding model {snapshot_model.get('name')} "
+        f"(dimension {snapshot_model.get('dimension')}), "
+        f"but this system uses {model_info.get('name')} (dimension {model_info.get('dimension')})"
+      )
+
+  snapshot_revision, revision = snapshot_model.get('revision'), model_info.get('revision')
+  if snapshot_revision and revision and snapshot_revision != revision:
+    raise SnapshotError(
+      f"Snapshot was built with revision {snapshot_revision} of {model_info.get('name')}, "
+      f"but this system uses revision {revision}"
+    )
+
+  snapshot_version, version = snapshot_model.get('library_version'), model_info.get('library_version')
+  if snapshot_version and version and _major_minor(snapshot_version) != _major_minor(version):
+    raise SnapshotError(
+      f"Snapshot was built with sentence-transformers {snapshot_version}, "
+      f"but this system uses {version}"
+    )
+
+
+def load_snapshot(generation: IndexGeneration, path: str, batch_size: int = 1000) -> Dict:
+  """Bulk-load snapshot vào một generation rỗng (collections + side files)"""
+
+  manifest = read_snapshot_manifest(path)
+  counts = {}
+
+  with zipfile.ZipFile(path, 'r') as archive:
+    for entry in manifest['collections']:
+      if entry['kind'] == 'folder_metadata':
+        collection = generation.folder_collection
+      elif entry['kind'] == 'document_vectors':
+        collection = generation.document_vector_collection
+      else:
+        collection = generation.get_or_create_shard(entry['legal_domain'])
+
+      records = json.loads(archive.read(f"{entry['path']}/records.json"))
+      arrays = {'vectors': _read_array(archive, f"{entry['path']}/vectors.npy")}
+      if f"{entry['path']}/scales.npy" in archive.namelist():
+        arrays['scales'] = _read_array(archive, f"{entry['path']}/scales.npy")
+      vectors = dequantize_vectors(arrays)
+
+      ids = records['ids']
+      documents = records['documents']
+      for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        batch = {
+          'ids': ids[start:end],
+          'embeddings': vectors[start:end].tolist(),
+          'metadatas': records['metadatas'][start:end]
+        }
+        if documents is not None and any(doc is not None for doc in documents[start:end]):
+          batch['documents'] = documents[start:end]
+        collection.add(**batch)
+
+      counts[entry.get('legal_domain', entry['kind'])] = len(ids)
+
+    side_paths = _side_files(generation)
+    for name in manifest['side_files']:
+      target = side_paths[name]
+      os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+      with open(target, 'wb') as f:
+        f.write(archive.read(f"side_files/{name}"))
+
+  return {'manifest': manifest, 'counts': counts}
+
+
+def main():
+  """Export / import index snapshot: python3 -m core.index_snapshot export|import <path>"""
+
+  parser = argparse.ArgumentParser(description="Export / import index snapshot cho Legal RAG")
+  parser.add_argument("command", choices=["export", "import"])
+  parser.add_argument("path", help="Đường dẫn file snapshot (.zip)")
+  parser.add_argument("--vector-dtype", default="float16", choices=VECTOR_DTYPES)
+  parser.add_argument("--data-path", default="./law_documents")
+  parser.add_argument("--persist-directory", default="./db/chroma_db")
+  parser.add_argument("--embedding-model", default="sentence-transformers/all-MiniLM-L6-v2")
+  args = parser.parse_args()
+
+  from core.hierarchical_rag_system import HierarchicalRAGSystem
+
+  rag_system = HierarchicalRAGSystem(
+    data_path=args.data_path,
+    embedding_model=args.embedding_model,
+    persist_directory=args.persist_directory
+  )
+
+  if args.command == "export":
+    manifest = rag_system.export_snapshot(args.path, vector_dtype=args.vector_dtype)
+    print(f"📦 Exported generation {manifest['source_generation']} to {args.path}: "
+          f"{sum(entry['count'] for entry in manifest['collections'])} records ({args.vector_dtype})")
+  else:
+    result = rag_system.import_snapshot(args.path)
+    print(f"📥 Imported snapshot: {result}")
+
+
+if __name__ == "__main__":
+  main()
@@ -15,72 +15,192 @@ class LegalRAGQueryEngine:
   def answer_question(
     self,
     question: str,
-    context_limit: int = 5000
+    context_token_limit: int = 4000,
+    search_results: Optional[Dict] = None,
+    top_k: int = 10
   ) -> Dict:
     """Trả lời câu hỏi dựa trên RAG results"""
     
-    # Search relevant documents
-    search_results = self.rag_system.search(question, top_k=10)
+    # Dùng lại search results nếu caller đã search, tránh search lần 2
+    if search_results is None:
+      search_results = self.rag_system.search(question, top_k=top_k)
 
-    # Build context từ top results
-    context_chunks = []
-    current_length = 0
-
-    for result in search_results['results']:
-      chunk_text = result['content']
-      chunk_length = len(chunk_text)
-      
-      if current_length + chunk_length <= context_limit:
-        context_chunks.append({
-          'text': chunk_text,
-          'source': f"{result['source_info']['folder']}/{result['source_info']['file']}",
-          'relevance': result['relevance_score']
-        })
-        current_length += chunk_length
-      else:
-        break
+    # Chọn chunks theo token budget, ưu tiên relevance trên mỗi token
+    selected_chunks, used_tokens = self._pack_context_chunks(
+      search_results['results'],
+      context_token_limit
+    )
+    
+    # Gộp các chunks liền kề của cùng document, bỏ phần overlap
+    context_chunks = self._merge_adjacent_chunks(selected_chunks)
     
     # Prepare response
     response = {
       'question': question,
       'context_used': context_chunks,
-      'sources': list(set([chunk['source'] for chunk in context_chunks])),
-      'total_context_length': current_length,
+      'sources': list(dict.fromkeys(chunk['source'] for chunk in context_chunks)),
+      'total_context_length': sum(len(chunk['text']) for chunk in context_chunks),
+      'total_context_tokens': used_tokens,
       'search_metadata': {
         'total_results_found': search_results['total_results'],
-        'chunks_used_for_context': len(context_chunks)
+        'chunks_used_for_context': len(selected_chunks),
+        'context_blocks': len(context_chunks)
       }
     }
     
     return response
+
+
+  def _chunk_token_count(self, result: Dict) -> int:
+    """Lấy token count đã lưu trong metadata, fallback sang tokenizer"""
+    
+    token_count = result['metadata'].get('token_count')
+    if token_count:
+      return int(token_count)
+    return len(self.rag_system.processor.encoding.encode(result['content']))
+
+
+  def _chunk_overlap(self, left: Dict, right: Dict) -> int:
+    """Độ dài phần overlap giữa hai chunks liên tiếp, ưu tiên dùng offsets đã lưu"""
+    
+    left_end = left['result']['metadata'].get('end_char', -1)
+    right_start = right['result']['metadata'].get('start_char', -1)
+    
+    if left_end >= 0 and right_start >= 0:
+      return min(max(0, left_end - right_start), len(right['result']['content']))
+    return self._overlap_length(left['result']['content'], right['result']['content'])
+
+
+  def _overlap_length(self, left_text: str, right_text: str, min_overlap: int = 20) -> int:
+    """Độ dài đoạn cuối của left_text trùng với đoạn đầu của right_text"""
+    
+    max_overlap = min(len(left_text), len(right_text), self.rag_system.processor.chunk_overlap)
+    
+    for size in range(max_overlap, min_overlap - 1, -1):
+      if left_text.endswith(right_text[:size]):
+        return size
+    return 0
+
+
+  def _pack_context_chunks(self, results: List[Dict], token_limit: int) -> Tuple[List[Dict], int]:
+    """
+    Chọn chunks cho context theo token budget:
+      1. Sắp xếp theo relevance / token
+      2. Bỏ qua chunk không vừa budget thay vì dừng hẳn
+      3. Không tính token phần overlap với chunk liền kề đã chọn
+    """
+    
+    candidates = []
+    for result in results:
+      candidates.append({
+        'result': result,
+        'document_id': result['metadata'].get('document_id'),
+        'chunk_index': int(result['metadata'].get('chunk_index', 0)),
+        'tokens': max(1, self._chunk_token_count(result))
+      })
+      
+    candidates.sort(key=lambda c: c['result']['relevance_score'] / c['tokens'], reverse=True)
+    
+    selected = {}
+    used_tokens = 0
+    
+    for candidate in candidates:
+      key = (candidate['document_id'], candidate['chunk_index'])
+      if key in selected:
+        continue
+      
+      text = candidate['result']['content']
+      cost = candidate['tokens']
+      
+      # Trừ phần overlap với chunk trước / sau đã nằm trong context (chunk rỗng không có overlap)
+      previous = selected.get((candidate['document_id'], candidate['chunk_index'] - 1))
+      if previous and text:
+        overlap = self._chunk_overlap(previous, candidate)
+        cost -= candidate['tokens'] * overlap // len(text)
+      following = selected.get((candidate['document_id'], candidate['chunk_index'] + 1))
+      if following and text:
+        overlap = self._chunk_overlap(candidate, following)
+        cost -= candidate['tokens'] * overlap // len(text)
+        
+      if used_tokens + cost <= token_limit:
+        selected[key] = candidate
+        used_tokens += cost
+        
+    return list(selected.values()), used_tokens
+
+
+  def _merge_adjacent_chunks(self, selected_chunks: List[Dict]) -> List[Dict]:
+    """Gộp chunks liên tiếp của cùng document thành một đoạn context"""
+    
+    by_document = {}
+    for candidate in selected_chunks:
+      by_document.setdefault(candidate['document_id'], []).append(candidate)
+      
+    context_chunks = []
+    
+    for candidates in by_document.values():
+      candidates.sort(key=lambda c: c['chunk_index'])
+      
+      run = [candidates[0]]
+      for candidate in candidates[1:]:
+        if candidate['chunk_index'] == run[-1]['chunk_index'] + 1:
+          run.append(candidate)
+        else:
+          context_chunks.append(self._build_context_block(run))
+          run = [candidate]
+      context_chunks.append(self._build_context_block(run))
+      
+    # Block liên quan nhất đứng trước
+    context_chunks.sort(key=lambda chunk: chunk['relevance'], reverse=True)
+    return context_chunks
+
+
+  def _build_context_block(self, run: List[Dict]) -> Dict:
+    """Nối text của một dãy chunks liên tiếp, bỏ phần overlap lặp lại"""
+    
+    text = run[0]['result']['content']
+    for previous, candidate in zip(run, run[1:]):
+      next_text = candidate['result']['content']
+      overlap = self._chunk_overlap(previous, candidate)
+      text += next_text[overlap:] if overlap else f"\n{next_text}"
+      
+    first = run[0]['result']
+    total_chunks = first['metadata'].get('total_chunks', '?')
+    chunk_range = f"{run[0]['chunk_index'] + 1}-{run[-1]['chunk_index'] + 1}" if len(run) > 1 else f"{run[0]['chunk_index'] + 1}"
+    
+    # Kết quả từ citation index: vị trí là chính trích dẫn (vd. "Điều 5 209/2013/NĐ-CP")
+    chunk_position = first['metadata'].get('citation') or f"{chunk_range}/{total_chunks}"
+    
+    return {
+      'text': text,
+      'source': f"{first['source_info']['folder']}/{first['source_info']['file']}",
+      'chunk_position': chunk_position,
+      'relevance': max(c['result']['relevance_score'] for c in run)
+    }
     
   
   def get_related_documents(self, document_id: str, top_k: int = 5) -> List[Dict]:
     """Tìm documents liên quan đến một document cụ thể"""
     
-    # Lấy document hiện tại
-    current_doc = self.rag_system.document_collection.get(
-      ids=[document_id],
-      include=['documents', 'metadatas']
-    )
-    
-    if not current_doc['documents']:
-      return []
+    # Chấp nhận cả chunk id, quy về document id
+    document_id = document_id.split('_chunk_')[0]
     
-    # Search bằng content của document
-    current_text = current_doc['documents'][0]
-    folder_id = current_doc['metadatas'][0]['folder_id']
+    # Đọc trực tiếp từ related-documents graph đã build lúc index
+    related = self.rag_system.get_related_document_ids(document_id, top_k)
     
-    # Search trong cùng folder và folders liên quan
-    related_results = self.rag_system.search(
-      query=current_text[:500],  # Use first 500 chars as query
-      top_k=top_k + 5
-    )
-    
-    # Filter out chính document đó
-    filtered_results = [
-      result for result in related_results['results']
-      if result['metadata']['document_id'] != current_doc['metadatas'][0]['document_id']
-    ]
+    results = []
+    for related_id, similarity in related:
+      metadata = self.rag_system.document_cache.get(related_id, {})
+      folder_meta = self.rag_system.folder_cache.get(metadata.get('folder_id'))
+      
+      results.append({
+        'document_id': related_id,
+        'metadata': metadata,
+        'relevance_score': similarity,
+        'source_info': {
+          'folder': folder_meta.folder_name if folder_meta else '',
+          'file': metadata.get('file_name', '')
+        }
+      })
     
-    return filtered_results[:top_k]
\ No newline at end of file
+    return results
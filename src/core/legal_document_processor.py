@@ -112,16 +112,21 @@ class LegalDocumentProcessor:
     chunks = self.text_splitter.split_text(text)
 
     chunk_docs = []
+    search_from = 0
 
     for i, chunk in enumerate(chunks):
       chunk_id = f"{metadata['document_id']}_chunk_{i}"
 
+      # Vị trí ký tự của chunk trong document (chunks sau có thể overlap chunk trước)
+      start_char = text.find(chunk, search_from)
+      if start_char >= 0:
+        search_from = start_char + 1
+
       chunk_metadata = {
         **metadata,
-        'chunk_id': chunk_id,
         'chunk_index': i,
-        'total_chunks': len(chunks),
-        'chunk_length': len(chunk),
+        'start_char': start_char,
+        'end_char': start_char + len(chunk) if start_char >= 0 else -1,
         'token_count': len(self.encoding.encode(chunk))
       }
 
@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import re
+import zlib
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def normalize_text(text: str) -> List[str]:
+  """Tokens đã chuẩn hóa (lowercase, bỏ dấu câu) để so sánh nội dung"""
+  return re.findall(r"\w+", text.lower())
+
+
+class MinHasher:
+  """MinHash signature trên word shingles"""
+
+  def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1, block_size: int = 1024):
+    self.num_perm = num_perm
+    self.shingle_size = shingle_size
+    self.block_size = block_size
+
+    # a, b < 2^32 để a * h + b không tràn uint64 với h là crc32
+    rng = np.random.RandomState(seed)
+    self.a = rng.randint(1, 1 << 32, num_perm, dtype=np.uint64)
+    self.b = rng.randint(0, 1 << 32, num_perm, dtype=np.uint64)
+
+
+  def signature(self, tokens: List[str]) -> np.ndarray:
+    k = self.shingle_size
+    shingles = {" ".join(tokens[i:i + k]) for i in range(max(1, len(tokens) - k + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+    # Permute từng block shingles, giữ min chạy -> bộ nhớ O(block_size * num_perm) thay vì O(n * num_perm)
+    signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+    for start in range(0, len(hashes), self.block_size):
+      block = hashes[start:start + self.block_size]
+      permuted = (np.outer(block, self.a) + self.b) % _MERSENNE_PRIME & _MAX_HASH
+      np.minimum(signature, permuted.min(axis=0), out=signature)
+    return signature
+
+
+class DuplicateIndex:
+  """
+  Phát hiện chunks / documents trùng hoặc gần trùng lúc ingestion (exact hash + MinHash/LSH).
+  Chỉ bản trùng hoàn toàn (cùng exact hash) mới trỏ về bản canonical, vẫn giữ lại làm nguồn trích dẫn;
+  bản gần trùng (vd. điều khoản sửa "10%" thành "8%") vẫn phải lưu nội dung riêng, chỉ có thể dùng lại vector.
+  """
+
+  def __init__(self, path: str, threshold: float = 0.9, num_perm: int = 64, bands: int = 16):
+    self.path = path
+    self.threshold = threshold
+    self.bands = bands
+    self.rows = num_perm // bands
+    self.hasher = MinHasher(num_perm=num_perm)
+
+    # Fingerprints của bản canonical: key -> (exact hash, signature)
+    self.chunk_fingerprints: Dict[str, Tuple[str, np.ndarray]] = {}
+    self.document_fingerprints: Dict[str, Tuple[str, np.ndarray]] = {}
+
+    # Bản trùng -> bản canonical
+    self.chunk_aliases: Dict[str, str] = {}
+    self.document_aliases: Dict[str, str] = {}
+
+    # Folder có bản trùng -> folders chứa bản canonical (dùng khi route query theo folder)
+    self.folder_links: Dict[str, List[str]] = {}
+
+    self._rebuild_lookups()
+
+
+  def _rebuild_lookups(self):
+    """Tạo lại các map phụ (exact hash, LSH buckets, reverse aliases) từ dữ liệu chính"""
+
+    self._exact = {"chunk": {}, "document": {}}
+    self._buckets = {"chunk": {}, "document": {}}
+    for kind, fingerprints in (("chunk", self.chunk_fingerprints), ("document", self.document_fingerprints)):
+      for key, (exact_hash, signature) in fingerprints.items():
+        self._index_fingerprint(kind, key, exact_hash, signature)
+
+    self._chunk_sources: Dict[str, List[str]] = {}
+    for alias, canonical in self.chunk_aliases.items():
+      self._chunk_sources.setdefault(canonical, []).append(alias)
+
+    self._document_sources: Dict[str, List[str]] = {}
+    for alias, canonical in self.document_aliases.items():
+      self._document_sources.setdefault(canonical, []).append(alias)
+
+
+  def _fingerprint(self, text: str) -> Tuple[str, np.ndarray]:
+    tokens = normalize_text(text)
+    exact_hash = hashlib.sha1(" ".join(tokens).encode("utf-8")).hexdigest()
+    return exact_hash, self.hasher.signature(tokens)
+
+
+  def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+    return [
+      (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+      for band in range(self.bands)
+    ]
+
+
+  def _index_fingerprint(self, kind: str, key: str, exact_hash: str, signature: np.ndarray):
+    self._exact[kind].setdefault(exact_hash, key)
+    for band_key in self._band_keys(signature):
+      self._buckets[kind].setdefault(band_key, []).append(key)
+
+
+  def _find(self, kind: str, text: str) -> Tuple[Optional[str], Tuple[str, np.ndarray]]:
+    """Tìm bản canonical có cùng nội dung (exact hash) với text, trả về (canonical key hoặc None, fingerprint)"""
+
+    exact_hash, signature = self._fingerprint(text)
+    return self._exact[kind].get(exact_hash), (exact_hash, signature)
+
+
+  def find_duplicate_chunk(self, text: str) -> Tuple[Optional[str], Tuple[str, np.ndarray]]:
+    return self._find("chunk", text)
+
+
+  def find_duplicate_document(self, text: str) -> Tuple[Optional[str], Tuple[str, np.ndarray]]:
+    return self._find("document", text)
+
+
+  def find_similar_chunk(self, fingerprint: Tuple[str, np.ndarray]) -> Optional[str]:
+    """LSH: chunk canonical gần trùng nhất (Jaccard ước lượng >= threshold), chỉ so sánh candidates cùng bucket"""
+
+    signature = fingerprint[1]
+    best_key, best_score = None, self.threshold
+    seen = set()
+    for band_key in self._band_keys(signature):
+      for key in self._buckets["chunk"].get(band_key, []):
+        if key in seen:
+          continue
+        seen.add(key)
+        score = float(np.mean(self.chunk_fingerprints[key][1] == signature))
+        if score >= best_score:
+          best_key, best_score = key, score
+
+    return best_key
+
+
+  def register_chunk(self, chunk_id: str, fingerprint: Tuple[str, np.ndarray]):
+    """Ghi nhận chunk canonical (đã được embed)"""
+    self.chunk_fingerprints[chunk_id] = fingerprint
+    self._index_fingerprint("chunk", chunk_id, *fingerprint)
+
+
+  def register_document(self, document_id: str, fingerprint: Tuple[str, np.ndarray]):
+    """Ghi nhận document canonical"""
+    self.document_fingerprints[document_id] = fingerprint
+    self._index_fingerprint("document", document_id, *fingerprint)
+
+
+  def add_chunk_alias(self, chunk_id: str, canonical_chunk_id: str):
+    self.chunk_aliases[chunk_id] = canonical_chunk_id
+    self._chunk_sources.setdefault(canonical_chunk_id, []).append(chunk_id)
+
+
+  def add_document_alias(self, document_id: str, canonical_document_id: str):
+    self.document_aliases[document_id] = canonical_document_id
+    self._document_sources.setdefault(canonical_document_id, []).append(document_id)
+
+
+  def link_folders(self, folder_id: str, canonical_folder_id: str):
+    """Folder chứa bản trùng cần search thêm folder chứa bản canonical"""
+    if folder_id == canonical_folder_id:
+      return
+    links = self.folder_links.setdefault(folder_id, [])
+    if canonical_folder_id not in links:
+      links.append(canonical_folder_id)
+
+
+  def alias_documents(self, canonical_chunk_id: str) -> List[str]:
+    """Các documents khác cũng chứa nội dung của một chunk canonical"""
+
+    document_id = canonical_chunk_id.split("_chunk_")[0]
+    documents = list(self._document_sources.get(document_id, []))
+    for alias in self._chunk_sources.get(canonical_chunk_id, []):
+      alias_document = alias.split("_chunk_")[0]
+      if alias_document not in documents and alias_document != document_id:
+        documents.append(alias_document)
+    return documents
+
+
+  def same_content(self, chunk_id: str, other_chunk_id: str) -> bool:
+    """Hai chunks canonical có cùng nội dung sau chuẩn hóa (exact hash)"""
+
+    first = self.chunk_fingerprints.get(chunk_id)
+    second = self.chunk_fingerprints.get(other_chunk_id)
+    return first is not None and second is not None and first[0] == second[0]
+
+
+  def similarity(self, chunk_id: str, other_chunk_id: str) -> float:
+    """Ước lượng Jaccard giữa hai chunks canonical, 0 nếu không có fingerprint"""
+
+    first = self.chunk_fingerprints.get(chunk_id)
+    second = self.chunk_fingerprints.get(other_chunk_id)
+    if first is None or second is None:
+      return 0.0
+    if first[0] == second[0]:
+      return 1.0
+    return float(np.mean(first[1] == second[1]))
+
+
+  def remove_document(self, document_id: str) -> List[str]:
+    """
+    Xóa fingerprints và aliases của một document.
+    Trả về các documents đang trỏ vào nội dung của document này (cần index lại).
+    """
+
+    prefix = f"{document_id}_chunk_"
+    orphans = set(self._document_sources.get(document_id, []))
+
+    for chunk_id in [key for key in self.chunk_fingerprints if key.startswith(prefix)]:
+      for alias in self._chunk_sources.get(chunk_id, []):
+        orphans.add(alias.split("_chunk_")[0])
+      del self.chunk_fingerprints[chunk_id]
+
+    self.document_fingerprints.pop(document_id, None)
+    self.document_aliases.pop(document_id, None)
+    for alias in [key for key in self.chunk_aliases if key.startswith(prefix)]:
+      del self.chunk_aliases[alias]
+
+    orphans.discard(document_id)
+    for orphan in orphans:
+      self.document_aliases.pop(orphan, None)
+      orphan_prefix = f"{orphan}_chunk_"
+      for alias in [key for key in self.chunk_aliases if key.startswith(orphan_prefix)]:
+        del self.chunk_aliases[alias]
+
+    self._rebuild_lookups()
+    return sorted(orphans)
+
+
+  def save(self) -> None:
+    """Persist index ra file JSON (ghi file tạm rồi replace)"""
+
+    def dump(fingerprints):
+      return {key: [exact_hash, signature.tolist()] for key, (exact_hash, signature) in fingerprints.items()}
+
+    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+    tmp_path = f"{self.path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      json.dump({
+        'threshold': self.threshold,
+        'chunk_fingerprints': dump(self.chunk_fingerprints),
+        'document_fingerprints': dump(self.document_fingerprints),
+        'chunk_aliases': self.chunk_aliases,
+        'document_aliases': self.document_aliases,
+        'folder_links': self.folder_links
+      }, f)
+    os.replace(tmp_path, self.path)
+
+
+  def load(self) -> bool:
+    """Load index đã persist, trả về False nếu chưa có"""
+
+    if not os.path.exists(self.path):
+      return False
+
+    def parse(fingerprints):
+      return {
+        key: (exact_hash, np.asarray(signature, dtype=np.uint64))
+        for key, (exact_hash, signature) in fingerprints.items()
+      }
+
+    try:
+      with open(self.path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+      self.chunk_fingerprints = parse(data.get('chunk_fingerprints', {}))
+      self.document_fingerprints = parse(data.get('document_fingerprints', {}))
+      self.chunk_aliases = data.get('chunk_aliases', {})
+      self.document_aliases = data.get('document_aliases', {})
+      self.folder_links = data.get('folder_links', {})
+      self._rebuild_lookups()
+      return True
+    except Exception as e:
+      print(f"Error loading duplicate index from {self.path}: {e}")
+      return False
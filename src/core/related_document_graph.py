@@ -0,0 +1,162 @@
+import json
+import os
+import numpy as np
+from typing import List, Dict, Optional, Tuple, Iterable
+
+
+class RelatedDocumentGraph:
+  """Sparse top-k kNN graph giữa các documents, dựa trên document vectors"""
+
+  def __init__(self, path: str, top_k: int = 10, block_size: int = 256):
+    self.path = path
+    self.top_k = top_k
+    self.block_size = block_size
+
+    # document_id -> [(related_document_id, similarity), ...] sort giảm dần
+    self.neighbors: Dict[str, List[Tuple[str, float]]] = {}
+
+
+  @staticmethod
+  def _normalize(vectors) -> np.ndarray:
+    """Chuẩn hóa L2 để dot product = cosine similarity"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+  def _compute_rows(
+    self,
+    row_ids: List[str],
+    document_ids: List[str],
+    matrix: np.ndarray
+  ) -> Dict[str, List[Tuple[str, float]]]:
+    """Tính top-k neighbors cho row_ids, theo từng block ma trận"""
+
+    index_of = {doc_id: i for i, doc_id in enumerate(document_ids)}
+    k = min(self.top_k, len(document_ids) - 1)
+    rows = {}
+
+    if k <= 0:
+      return {doc_id: [] for doc_id in row_ids}
+
+    for start in range(0, len(row_ids), self.block_size):
+      block_ids = row_ids[start:start + self.block_size]
+      block_positions = [index_of[doc_id] for doc_id in block_ids]
+      scores = matrix[block_positions] @ matrix.T
+
+      # Loại chính document đó
+      scores[np.arange(len(block_ids)), block_positions] = -np.inf
+
+      top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+      for row, doc_id in enumerate(block_ids):
+        ordered = top[row][np.argsort(-scores[row, top[row]])]
+        rows[doc_id] = [(document_ids[j], float(scores[row, j])) for j in ordered]
+
+    return rows
+
+
+  def build(self, document_ids: List[str], vectors) -> None:
+    """Build toàn bộ graph từ document vectors"""
+
+    matrix = self._normalize(vectors)
+    self.neighbors = self._compute_rows(list(document_ids), list(document_ids), matrix)
+
+
+  def update(
+    self,
+    document_ids: List[str],
+    vectors,
+    changed_ids: Iterable[str] = (),
+    removed_ids: Iterable[str] = ()
+  ) -> int:
+    """
+    Cập nhật incremental khi documents thay đổi:
+      1. Xóa rows của documents bị xóa / thay đổi
+      2. Rows có neighbor bị xóa / thay đổi -> tính lại toàn bộ row
+      3. Rows còn lại chỉ cần so sánh thêm với documents thay đổi
+    Trả về số rows đã tính lại.
+    """
+
+    document_ids = list(document_ids)
+    matrix = self._normalize(vectors)
+    index_of = {doc_id: i for i, doc_id in enumerate(document_ids)}
+
+    changed = {doc_id for doc_id in changed_ids if doc_id in index_of}
+    stale = changed | set(removed_ids)
+
+    for doc_id in stale:
+      self.neighbors.pop(doc_id, None)
+
+    dirty = set(changed)
+    for doc_id, related in list(self.neighbors.items()):
+      if doc_id not in index_of:
+        del self.neighbors[doc_id]
+      elif any(related_id in stale for related_id, _ in related):
+        dirty.add(doc_id)
+
+    # Documents mới chưa có row
+    dirty.update(doc_id for doc_id in document_ids if doc_id not in self.neighbors)
+
+    self.neighbors.update(self._compute_rows(sorted(dirty), document_ids, matrix))
+
+    # Vá rows không dirty: chỉ cần xét thêm documents thay đổi
+    if changed:
+      changed_list = sorted(changed)
+      changed_matrix = matrix[[index_of[doc_id] for doc_id in changed_list]]
+      clean_ids = [doc_id for doc_id in document_ids if doc_id not in dirty]
+
+      for start in range(0, len(clean_ids), self.block_size):
+        block_ids = clean_ids[start:start + self.block_size]
+        scores = matrix[[index_of[doc_id] for doc_id in block_ids]] @ changed_matrix.T
+
+        for row, doc_id in enumerate(block_ids):
+          merged = self.neighbors[doc_id] + [
+            (changed_list[j], float(scores[row, j])) for j in range(len(changed_list))
+          ]
+          merged.sort(key=lambda item: item[1], reverse=True)
+          self.neighbors[doc_id] = merged[:self.top_k]
+
+    return len(dirty)
+
+
+  def get(self, document_id: str, top_k: Optional[int] = None) -> List[Tuple[str, float]]:
+    """Lấy related documents của một document"""
+    related = self.neighbors.get(document_id, [])
+    return related[:top_k] if top_k else list(related)
+
+
+  def save(self) -> None:
+    """Persist graph ra file JSON (ghi file tạm rồi replace)"""
+
+    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+    tmp_path = f"{self.path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      json.dump({
+        'top_k': self.top_k,
+        'neighbors': {
+          doc_id: [[related_id, round(score, 6)] for related_id, score in related]
+          for doc_id, related in self.neighbors.items()
+        }
+      }, f)
+    os.replace(tmp_path, self.path)
+
+
+  def load(self) -> bool:
+    """Load graph đã persist, trả về False nếu chưa có"""
+
+    if not os.path.exists(self.path):
+      return False
+
+    try:
+      with open(self.path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+      self.top_k = data.get('top_k', self.top_k)
+      self.neighbors = {
+        doc_id: [(related_id, float(score)) for related_id, score in related]
+        for doc_id, related in data.get('neighbors', {}).items()
+      }
+      return True
+    except Exception as e:
+      print(f"Error loading related documents graph from {self.path}: {e}")
+      return False
@@ -0,0 +1,392 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
+from core.deadline import Deadline
+
+
+DEFAULT_ADDRESS = os.environ.get("LAW_RAG_SERVER", "127.0.0.1:8765")
+
+
+def parse_address(address: str) -> Tuple[int, Any]:
+  """
+  Parse địa chỉ server:
+    - "unix:/path/to/socket" -> Unix domain socket
+    - "host:port" -> TCP localhost
+  """
+  if address.startswith("unix:"):
+    return socket.AF_UNIX, address[len("unix:"):]
+
+  host, _, port = address.rpartition(":")
+  return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _json_default(obj):
+  """Chuyển numpy scalars / arrays về kiểu JSON"""
+  if hasattr(obj, "tolist"):
+    return obj.tolist()
+  raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_message(message: Dict) -> bytes:
+  """Mỗi message là một dòng JSON"""
+  return json.dumps(message, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8") + b"\n"
+
+
+class ServerBusyError(RuntimeError):
+  """Request queue của server đã đầy"""
+
+
+class DeadlineExceededError(RuntimeError):
+  """Deadline của request đã hết trước khi server bắt đầu xử lý (vd. chờ quá lâu trong queue)"""
+
+
+class ServerUnavailableError(ConnectionError):
+  """Không có server nào đang chạy ở địa chỉ này (connection refused / không có socket file)"""
+
+
+class RetrievalService:
+  """Giữ một RAG system warm và điều phối requests với concurrency control"""
+
+  def __init__(self, rag_system, max_concurrent: int = 4, max_queue: int = 32):
+    from core.law_rag_query_engine import LegalRAGQueryEngine
+
+    self.rag_system = rag_system
+    self.query_engine = LegalRAGQueryEngine(rag_system)
+
+    # Tối đa max_concurrent requests chạy cùng lúc, max_queue requests chờ
+    self.max_concurrent = max_concurrent
+    self.max_queue = max_queue
+    self._slots = threading.BoundedSemaphore(max_concurrent)
+    self._pending = 0
+    self._pending_lock = threading.Lock()
+
+    # Các thao tác ghi index chạy tuần tự
+    self._write_lock = threading.Lock()
+
+    self.started_at = time.time()
+    self.requests_served = 0
+
+    self.methods = {
+      'search': self.search,
+      'search_many': self.search_many,
+      'build_context': self.build_context,
+      'status': self.status,
+      'build_index': self.build_index
+    }
+
+
+  def handle(self, method: str, params: Dict) -> Any:
+    """Dispatch một request, từ chối nếu queue đã đầy"""
+
+    if method not in self.methods:
+      raise ValueError(f"Unknown method: {method}")
+
+    # status không chiếm slot để luôn trả lời được khi server bận
+    if method == 'status':
+      return self.status()
+
+    # Deadline tính từ lúc nhận request, thời gian chờ trong queue cũng trừ vào budget
+    deadline = None
+    if params.get('deadline') is not None:
+      deadline = Deadline(params['deadline'])
+      params = {**params, 'deadline': deadline}
+
+    with self._pending_lock:
+      if self._pending >= self.max_concurrent + self.max_queue:
+        raise ServerBusyError("Retrieval server is busy, retry later")
+      self._pending += 1
+
+    try:
+      # Chờ slot tối đa tới deadline; hết hạn trong queue thì từ chối thay vì vẫn chạy các stage bắt buộc
+      if not self._slots.acquire(timeout=None if deadline is None else max(0.0, deadline.remaining())):
+        raise DeadlineExceededError("Deadline exceeded while waiting in the request queue")
+      try:
+        if deadline is not None and deadline.expired():
+          raise DeadlineExceededError("Deadline exceeded while waiting in the request queue")
+        return self.methods[method](**params)
+      finally:
+        self._slots.release()
+    finally:
+      with self._pending_lock:
+        self._pending -= 1
+        self.requests_served += 1
+
+
+  def search(self, query: str, top_k: int = 5, **options) -> Dict:
+    return self.rag_system.search(query, top_k=top_k, **options)
+
+
+  def search_many(self, queries: List[str], top_k: int = 5, **options) -> List[Dict]:
+    return [self.rag_system.search(query, top_k=top_k, **options) for query in queries]
+
+
+  def build_context(
+    self,
+    question: str,
+    context_token_limit: int = 4000,
+    search_results: Optional[Dict] = None,
+    top_k: int = 10
+  ) -> Dict:
+    return self.query_engine.answer_question(
+      question,
+      context_token_limit=context_token_limit,
+      search_results=search_results,
+      top_k=top_k
+    )
+
+
+  def build_index(self, force_rebuild: bool = False, background: bool = True) -> Dict:
+    # Rebuild ghi vào generation mới, search vẫn phục vụ trong lúc build
+    with self._write_lock:
+      return self.rag_system.build_index(force_rebuild=force_rebuild, background=background)
+
+
+  def status(self) -> Dict:
+    with self._pending_lock:
+      pending = self._pending
+
+    return {
+      'folders': len(self.rag_system.folder_cache),
+      'documents': len(self.rag_system.document_cache),
+      'chunks': self.rag_system._count_document_chunks(),
+      'shards': sorted(self.rag_system.document_shards),
+      'generation': self.rag_system.active_index.generation,
+      'in_flight': pending,
+      'max_concurrent': self.max_concurrent,
+      'max_queue': self.max_queue,
+      'requests_served': self.requests_served,
+      'uptime_seconds': round(time.time() - self.started_at, 1)
+    }
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+  """Đọc từng dòng JSON request, trả về một dòng JSON response"""
+
+  def handle(self):
+    service = self.server.service
+
+    for line in self.rfile:
+      if not line.strip():
+        continue
+
+      request_id = None
+      try:
+        request = json.loads(line)
+        request_id = request.get('id')
+        result = service.handle(request['method'], request.get('params') or {})
+        response = {'id': request_id, 'ok': True, 'result': result}
+      except ServerBusyError as e:
+        response = {'id': request_id, 'ok': False, 'error': str(e), 'busy': True}
+      except DeadlineExceededError as e:
+        response = {'id': request_id, 'ok': False, 'error': str(e), 'deadline_exceeded': True}
+      except Exception as e:
+        response = {'id': request_id, 'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+      self.wfile.write(encode_message(response))
+      self.wfile.flush()
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+  class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(service: RetrievalService, address: str = DEFAULT_ADDRESS):
+  """Tạo socket server cho RetrievalService"""
+
+  family, bind_address = parse_address(address)
+
+  if family == socket.AF_UNIX:
+    if os.path.exists(bind_address):
+      os.remove(bind_address)
+    server = _ThreadingUnixServer(bind_address, _RequestHandler)
+  else:
+    server = _ThreadingTCPServer(bind_address, _RequestHandler)
+
+  server.service = service
+  return server
+
+
+class RetrievalClient:
+  """Thin client cho retrieval server, giữ một connection mở"""
+
+  def __init__(
+    self,
+    address: str = DEFAULT_ADDRESS,
+    timeout: float = 30.0,
+    connect_timeout: float = 0.2,
+    deadline_grace: float = 1.0
+  ):
+    self.address = address
+    self.timeout = timeout
+    self.connect_timeout = connect_timeout
+
+    # Request có deadline: chờ response tối đa deadline còn lại + grace (server vẫn chạy các stage bắt buộc)
+    self.deadline_grace = deadline_grace
+    self._sock = None
+    self._reader = None
+    self._next_id = 0
+    self._lock = threading.Lock()
+
+
+  def _connect(self):
+    family, connect_address = parse_address(self.address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(self.connect_timeout)
+    try:
+      sock.connect(connect_address)
+    except (ConnectionRefusedError, FileNotFoundError) as e:
+      sock.close()
+      raise ServerUnavailableError(f"No retrieval server at {self.address}") from e
+    except OSError:
+      sock.close()
+      raise
+    sock.settimeout(self.timeout)
+    self._sock = sock
+    self._reader = sock.makefile('rb')
+
+
+  def close(self):
+    if self._sock is not None:
+      self._reader.close()
+      self._sock.close()
+      self._sock = None
+      self._reader = None
+
+
+  def is_available(self) -> bool:
+    """Check server có đang chạy và trả lời được không (round-trip status)"""
+    try:
+      self.status()
+      return True
+    except (OSError, ValueError, RuntimeError):
+      self.close()
+      return False
+
+
+  def _send(self, request: Dict, timeout: float) -> bytes:
+    """Gửi request trên connection hiện tại, đọc một dòng response"""
+
+    if self._sock is None:
+      self._connect()
+
+    try:
+      self._sock.settimeout(timeout)
+      self._sock.sendall(encode_message(request))
+      line = self._reader.readline()
+    except OSError:
+      self.close()
+      raise
+
+    if not line:
+      self.close()
+      raise ConnectionError("Retrieval server closed the connection")
+    return line
+
+
+  def call(self, method: str, **params) -> Any:
+    """
+    Gửi một request và chờ response; connection cũ bị đứt (vd. server restart) thì kết nối lại và thử một lần nữa.
+    params['deadline'] (giây) giới hạn cả thời gian chờ response, không retry khi đã timeout hoặc hết deadline.
+    """
+
+    expires_at = None if params.get('deadline') is None else time.monotonic() + params['deadline']
+
+    def send_once() -> bytes:
+      self._next_id += 1
+      if expires_at is None:
+        return self._send({'id': self._next_id, 'method': method, 'params': params}, self.timeout)
+
+      remaining = expires_at - time.monotonic()
+      if remaining <= 0:
+        raise DeadlineExceededError("Deadline exceeded before the request was sent")
+      request = {'id': self._next_id, 'method': method, 'params': {**params, 'deadline': remaining}}
+      return self._send(request, min(self.timeout, remaining + self.deadline_grace))
+
+    with self._lock:
+      reused = self._sock is not None
+      try:
+        line = send_once()
+      except socket.timeout:
+        raise
+      except OSError:
+        if not reused:
+          raise
+        line = send_once()
+
+    response = json.loads(line)
+    if not response.get('ok'):
+      if response.get('busy'):
+        raise ServerBusyError(response['error'])
+      if response.get('deadline_exceeded'):
+        raise DeadlineExceededError(response['error'])
+      raise RuntimeError(response.get('error', 'Unknown server error'))
+    return response['result']
+
+
+  def search(self, query: str, top_k: int = 5, **filters) -> Dict:
+    return self.call('search', query=query, top_k=top_k, **filters)
+
+
+  def search_many(self, queries: List[str], top_k: int = 5, **filters) -> List[Dict]:
+    return self.call('search_many', queries=queries, top_k=top_k, **filters)
+
+
+  def build_context(self, question: str, **params) -> Dict:
+    return self.call('build_context', question=question, **params)
+
+
+  def status(self) -> Dict:
+    return self.call('status')
+
+
+def main():
+  """Chạy retrieval server: python3 -m core.retrieval_server"""
+
+  from core.hierarchical_rag_system import HierarchicalRAGSystem
+
+  parser = argparse.ArgumentParser(description="Local retrieval server cho Legal RAG")
+  parser.add_argument("--address", default=DEFAULT_ADDRESS, help="host:port hoặc unix:/path/to/socket")
+  parser.add_argument("--data-path", default="./law_documents")
+  parser.add_argument("--persist-directory", default="./db/chroma_db")
+  parser.add_argument("--embedding-model", default="sentence-transformers/all-MiniLM-L6-v2")
+  parser.add_argument("--query-enhancement", default="text", choices=HierarchicalRAGSystem.QUERY_ENHANCEMENT_MODES)
+  parser.add_argument("--max-concurrent", type=int, default=4)
+  parser.add_argument("--max-queue", type=int, default=32)
+  args = parser.parse_args()
+
+  rag_system = HierarchicalRAGSystem(
+    data_path=args.data_path,
+    embedding_model=args.embedding_model,
+    persist_directory=args.persist_directory,
+    query_enhancement=args.query_enhancement
+  )
+
+  if not rag_system.has_existing_data():
+    print("No existing database found. Building index...")
+    print(f"Index built: {rag_system.build_index()}")
+
+  service = RetrievalService(rag_system, max_concurrent=args.max_concurrent, max_queue=args.max_queue)
+  server = create_server(service, args.address)
+
+  print(f"🚀 Retrieval server listening on {args.address}")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    print("Shutting down retrieval server...")
+  finally:
+    server.server_close()
+
+
+if __name__ == "__main__":
+  main()
@@ -1,5 +1,5 @@
 
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from typing import List, Dict, Any, Optional, Tuple
 
 
@@ -41,3 +41,17 @@ class FolderMetadata:
     
     
 
+
+@dataclass(slots=True)
+class ChunkCandidate:
+    """Kết quả trung gian lúc ranking: chỉ giữ ids và scores, chưa có content"""
+    chunk_id: str
+    document_id: str
+    folder_id: str
+    legal_domain: str
+    distance: float
+    doc_similarity: float = 0.0
+    folder_similarity: float = 0.0
+    authority_score: float = 0.0
+    combined_score: float = 0.0
+    duplicate_ids: List[str] = field(default_factory=list)
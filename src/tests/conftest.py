@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import modules như khi chạy từ src/ (from core.xxx import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,116 @@
+from core.citation_index import (
+  CitationIndex,
+  normalize_document_number,
+  parse_document_number,
+  parse_structure
+)
+
+
+DOCUMENT_TEXT = """CHÍNH PHỦ
+Số: 209/2013/NĐ-CP
+
+Chương I
+QUY ĐỊNH CHUNG
+
+Điều 1. Phạm vi điều chỉnh
+Nghị định này quy định chi tiết Luật thuế giá trị gia tăng.
+
+Điều 2. Đối tượng áp dụng
+1. Người nộp thuế.
+2. Cơ quan quản lý thuế.
+
+Chương II
+THUẾ SUẤT
+
+Điều 3. Thuế suất
+1. Thuế suất 0% áp dụng đối với:
+a) Hàng hóa xuất khẩu;
+b) Vận tải quốc tế;
+đ) Dòng bị bỏ qua vì sai thứ tự;
+c) Dịch vụ xuất khẩu.
+2. Thuế suất 5% áp dụng đối với nước sạch.
+Điều 5 của Luật được trích dẫn lại, không phải heading.
+3. Thuế suất 10% áp dụng đối với hàng hóa còn lại.
+
+Điều 4. Hiệu lực thi hành
+Nghị định này có hiệu lực từ ngày 01 tháng 01 năm 2014.
+"""
+
+
+def _index(tmp_path=None):
+  index = CitationIndex(str(tmp_path / "citations.json") if tmp_path else "unused.json")
+  index.add_document("doc1", "209/2013/NĐ-CP", DOCUMENT_TEXT)
+  return index
+
+
+def test_normalize_and_parse_document_number():
+  assert normalize_document_number("209_2013_NĐ-CP") == "209/2013/ND-CP"
+  assert normalize_document_number("209/2013/nđ - cp") == "209/2013/ND-CP"
+  assert parse_document_number("219_2013_TT-BTC.docx") == "219/2013/TT-BTC"
+  assert parse_document_number("van_ban.pdf", DOCUMENT_TEXT) == "209/2013/NĐ-CP"
+  assert parse_document_number("van_ban.pdf", "không có số hiệu") is None
+
+
+def test_parse_structure_only_accepts_headings_in_order():
+  articles = parse_structure(DOCUMENT_TEXT)
+
+  assert list(articles) == ["1", "2", "3", "4"]
+  assert articles["1"]["chapter"] == "I"
+  assert articles["3"]["chapter"] == "II"
+  assert articles["3"]["title"] == "Thuế suất"
+
+  # "Điều 5" trích dẫn bên trong Điều 3 không mở Điều mới
+  assert list(articles["3"]["clauses"]) == ["1", "2", "3"]
+
+  # Điểm đ) sai thứ tự bị bỏ qua, c) vẫn được nhận sau b)
+  points = articles["3"]["clauses"]["1"]["points"]
+  assert list(points) == ["a", "b", "c"]
+  assert DOCUMENT_TEXT[points["b"]["start"]:points["b"]["end"]].strip().startswith("b) Vận tải quốc tế")
+
+
+def test_parse_citation():
+  index = CitationIndex("unused.json")
+
+  assert index.parse_citation("điểm b khoản 1 Điều 3 Nghị định 209/2013/NĐ-CP") == {
+    'document_key': "209/2013/ND-CP",
+    'article': "3",
+    'clause': "1",
+    'point': "b"
+  }
+  assert index.parse_citation("Điều 3 văn bản 209/2013")['document_key'] == "209/2013"
+  assert index.parse_citation("thuế suất hàng xuất khẩu") is None
+  assert index.parse_citation("Điều 3 nói gì?") is None
+
+
+def test_lookup_resolves_provision_and_neighbors():
+  index = _index()
+
+  hits = index.lookup("điểm b khoản 1 Điều 3 Nghị định 209/2013/NĐ-CP")
+  assert len(hits) == 1
+  hit = hits[0]
+  assert hit['document_id'] == "doc1"
+  assert hit['citation'] == "Điểm b Khoản 1 Điều 3 209/2013/NĐ-CP"
+  assert hit['text'].startswith("b) Vận tải quốc tế")
+  assert hit['neighbors']['previous'].startswith("a) Hàng hóa xuất khẩu")
+  assert hit['neighbors']['next'].startswith("c) Dịch vụ xuất khẩu")
+
+  article = index.lookup("Điều 4 209/2013")[0]
+  assert article['citation'] == "Điều 4 209/2013/NĐ-CP"
+  assert article['neighbors']['previous'].startswith("Điều 3. Thuế suất")
+  assert 'next' not in article['neighbors']
+
+  assert index.lookup("Điều 9 209/2013/NĐ-CP") == []
+  assert index.lookup("Điều 1 Nghị định 999/2020/NĐ-CP") == []
+
+
+def test_remove_document_and_save_load(tmp_path):
+  index = _index(tmp_path)
+  index.save()
+
+  loaded = CitationIndex(index.path)
+  assert loaded.load()
+  assert loaded.lookup("khoản 2 Điều 2 209/2013/NĐ-CP")[0]['text'] == "2. Cơ quan quản lý thuế."
+
+  loaded.remove_document("doc1")
+  assert loaded.lookup("Điều 1 209/2013/NĐ-CP") == []
+  assert loaded.by_number == {}
@@ -0,0 +1,77 @@
+import math
+from types import SimpleNamespace
+
+import pytest
+import core.deadline
+from core.deadline import Deadline, StageLatencies
+
+
+@pytest.fixture
+def clock(monkeypatch):
+  """Đồng hồ giả cho time.monotonic trong core.deadline, tăng bằng clock.now += ..."""
+  clock = SimpleNamespace(now=100.0)
+  monkeypatch.setattr(core.deadline, "time", SimpleNamespace(monotonic=lambda: clock.now))
+  return clock
+
+
+def test_coerce_none_number_and_deadline(clock):
+  assert Deadline.coerce(None).expires_at is None
+  assert math.isinf(Deadline.coerce(None).remaining())
+  assert not Deadline.coerce(None).expired()
+
+  assert Deadline.coerce(2.5).expires_at == 102.5
+
+  # Dùng chung thời hạn nhưng skipped_stages riêng, không lẫn với request gốc
+  original = Deadline(timeout=1.0)
+  original.skipped_stages.append("rerank")
+  clock.now += 0.4
+  coerced = Deadline.coerce(original)
+
+  assert coerced is not original
+  assert coerced.expires_at == original.expires_at == 101.0
+  assert coerced.skipped_stages == []
+  assert coerced.remaining() == pytest.approx(0.6)
+
+
+def test_allows_records_skipped_stage(clock):
+  deadline = Deadline(timeout=1.0)
+
+  assert deadline.allows("query_enhancement", reserve=0.5)
+  assert deadline.skipped_stages == []
+
+  clock.now += 0.7
+  assert not deadline.allows("query_enhancement", reserve=0.5)
+  assert deadline.allows("search")
+  assert deadline.skipped_stages == ["query_enhancement"]
+
+  clock.now += 0.3
+  assert deadline.expired()
+  assert not deadline.allows("search")
+  assert deadline.skipped_stages == ["query_enhancement", "search"]
+
+  # Không giới hạn: luôn cho phép, không ghi gì
+  unlimited = Deadline()
+  assert unlimited.allows("search", reserve=1e9)
+  assert unlimited.skipped_stages == []
+
+
+def test_stage_latencies_ewma_and_estimate(clock):
+  latencies = StageLatencies(alpha=0.5)
+  assert latencies.estimate("search") == 0.0
+
+  latencies.observe("search", 1.0)
+  assert latencies.estimate("search") == 1.0
+  latencies.observe("search", 3.0)
+  assert latencies.estimate("search") == 2.0
+
+  with latencies.measure("rerank"):
+    clock.now += 0.25
+  assert latencies.estimate("rerank") == 0.25
+  assert latencies.estimate("search", "rerank", "unknown") == 2.25
+
+  # Stage lỗi vẫn được đo
+  with pytest.raises(RuntimeError):
+    with latencies.measure("rerank"):
+      clock.now += 0.75
+      raise RuntimeError("boom")
+  assert latencies.estimate("rerank") == 0.5
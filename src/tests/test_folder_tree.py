@@ -0,0 +1,90 @@
+import numpy as np
+from core.folder_tree import FolderTree
+
+
+def _unit(*components, dimension=4):
+  vector = np.zeros(dimension, dtype=np.float32)
+  vector[:len(components)] = components
+  return vector / np.linalg.norm(vector)
+
+
+def _tree(tmp_path=None, parents=None):
+  """
+  root_tax ─┬─ vat ── vat_rates
+            └─ cit
+  other
+  """
+  folder_ids = ["root_tax", "vat", "vat_rates", "cit", "other"]
+  vectors = [_unit(1, 1), _unit(1, 0.2), _unit(1, 0, 0.3), _unit(0.2, 1), _unit(0, 0, 0, 1)]
+  parents = parents or {"vat": "root_tax", "vat_rates": "vat", "cit": "root_tax"}
+
+  tree = FolderTree(str(tmp_path / "folder_tree.json") if tmp_path else "unused.json")
+  tree.build(folder_ids, vectors, parents)
+  return tree
+
+
+def test_build_links_children_and_summaries():
+  tree = _tree()
+
+  assert tree.children[None] == ["root_tax", "other"]
+  assert tree.children["root_tax"] == ["vat", "cit"]
+  assert tree.subtree("root_tax") == ["root_tax", "vat", "cit", "vat_rates"]
+
+  # Lá giữ nguyên vector, folder cha = self_weight * vector + (1 - self_weight) * trung bình summaries con
+  np.testing.assert_allclose(tree.summaries[tree._position["vat_rates"]], tree.vector("vat_rates"), rtol=1e-6)
+  expected = 0.5 * tree.vector("vat") + 0.5 * tree.summaries[tree._position["vat_rates"]]
+  np.testing.assert_allclose(tree.summaries[tree._position["vat"]], expected / np.linalg.norm(expected), rtol=1e-5)
+  np.testing.assert_allclose(np.linalg.norm(tree.summaries, axis=1), 1.0, rtol=1e-5)
+
+
+def test_unknown_parents_become_roots():
+  tree = _tree(parents={"vat": "missing", "vat_rates": "vat", "cit": "root_tax"})
+
+  assert tree.parents["vat"] is None
+  assert set(tree.children[None]) == {"root_tax", "vat", "other"}
+
+
+def test_cycles_are_broken():
+  tree = _tree(parents={"root_tax": "vat_rates", "vat": "root_tax", "vat_rates": "vat", "cit": "cit"})
+
+  # Mỗi folder vẫn đến được từ một folder gốc, không có vòng
+  reachable = [folder_id for root in tree.children[None] for folder_id in tree.subtree(root)]
+  assert sorted(reachable) == sorted(tree.folder_ids)
+  assert tree.parents["cit"] is None
+
+
+def test_beam_search_descends_into_best_subtree():
+  tree = _tree()
+
+  results = tree.beam_search(_unit(1, 0, 0.3), beam_width=1)
+  folder_ids = [folder_id for folder_id, _, _ in results]
+
+  # Beam 1: root_tax -> vat -> vat_rates, không xét cit / other
+  assert set(folder_ids) == {"root_tax", "vat", "vat_rates"}
+  assert folder_ids[0] == "vat_rates"
+  assert results[0][1] == results[0][2]
+
+  own_scores = [own for _, own, _ in results]
+  assert own_scores == sorted(own_scores, reverse=True)
+
+
+def test_wide_beam_scores_every_folder():
+  tree = _tree()
+
+  results = tree.beam_search(_unit(0, 0, 0, 1), beam_width=10)
+
+  assert sorted(folder_id for folder_id, _, _ in results) == sorted(tree.folder_ids)
+  assert results[0][0] == "other"
+  assert FolderTree("unused.json").beam_search(_unit(1)) == []
+
+
+def test_save_and_load_roundtrip(tmp_path):
+  tree = _tree(tmp_path)
+  tree.save()
+
+  loaded = FolderTree(tree.path)
+  assert loaded.load()
+  assert loaded.children == tree.children
+  query = _unit(1, 0.5, 0.1)
+  assert [item[0] for item in loaded.beam_search(query, 2)] == [item[0] for item in tree.beam_search(query, 2)]
+  assert not FolderTree(str(tmp_path / "missing.json")).load()
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from core.index_snapshot import SnapshotError, check_model_compatibility, dequantize_vectors, quantize_vectors
+
+
+MODEL_INFO = {
+  'name': "bkai-foundation-models/vietnamese-bi-encoder",
+  'dimension': 768,
+  'revision': "84f9d9ada0d1a3c37557398b9ae9fcedcdf40be0",
+  'library_version': "3.0.1"
+}
+
+
+def _vectors(count, dimension=32, seed=0):
+  return np.random.RandomState(seed).randn(count, dimension).astype(np.float32)
+
+
+def _manifest(**changes):
+  return {'embedding_model': {**MODEL_INFO, **changes}}
+
+
+def test_int8_roundtrip_error_is_bounded_by_half_a_step():
+  vectors = _vectors(50) * np.linspace(0.01, 10, 50, dtype=np.float32)[:, None]
+
+  arrays = quantize_vectors(vectors, "int8")
+  assert arrays['vectors'].dtype == np.int8
+  assert arrays['scales'].shape == (50, 1)
+
+  # Làm tròn về bước scale gần nhất: sai số mỗi phần tử <= scale / 2
+  error = np.abs(dequantize_vectors(arrays) - vectors)
+  assert np.all(error <= arrays['scales'] / 2 + 1e-6)
+  np.testing.assert_array_equal(np.abs(arrays['vectors']).max(axis=1), 127)
+
+
+def test_float16_roundtrip():
+  vectors = _vectors(10)
+
+  arrays = quantize_vectors(vectors, "float16")
+  assert arrays['vectors'].dtype == np.float16
+  assert 'scales' not in arrays
+  np.testing.assert_allclose(dequantize_vectors(arrays), vectors, rtol=1e-3, atol=1e-3)
+
+
+def test_int8_zero_rows():
+  vectors = _vectors(3)
+  vectors[1] = 0.0
+
+  arrays = quantize_vectors(vectors, "int8")
+  # Row toàn 0 không chia cho 0, khôi phục đúng bằng 0
+  assert arrays['scales'][1, 0] == 1.0
+  restored = dequantize_vectors(arrays)
+  assert np.all(np.isfinite(restored))
+  np.testing.assert_array_equal(restored[1], 0.0)
+
+  empty = quantize_vectors(np.zeros((0, 32), dtype=np.float32), "int8")
+  assert empty['vectors'].shape == (0, 32)
+  assert dequantize_vectors(empty).shape == (0, 32)
+
+
+def test_compatible_model_is_accepted():
+  check_model_compatibility(_manifest(), MODEL_INFO)
+
+  # Revision / library version chỉ so sánh khi cả hai bên đều ghi nhận được, patch version được bỏ qua
+  check_model_compatibility(_manifest(revision=None), MODEL_INFO)
+  check_model_compatibility(_manifest(), {**MODEL_INFO, 'revision': None})
+  check_model_compatibility(_manifest(library_version="3.0.9"), MODEL_INFO)
+
+
+@pytest.mark.parametrize("changes", [
+  {'name': "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"},
+  {'dimension': 384},
+  {'revision': "0000000000000000000000000000000000000000"},
+  {'library_version': "2.7.0"}
+])
+def test_mismatched_model_is_rejected(changes):
+  with pytest.raises(SnapshotError):
+    check_model_compatibility(_manifest(**changes), MODEL_INFO)
@@ -0,0 +1,124 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+# LegalRAGQueryEngine import kéo theo hierarchical_rag_system (chromadb, sentence-transformers, tiktoken)
+for module in ("chromadb", "sentence_transformers", "tiktoken"):
+  pytest.importorskip(module)
+
+from core.law_rag_query_engine import LegalRAGQueryEngine
+
+
+def _engine(chunk_overlap=20):
+  rag_system = SimpleNamespace(processor=SimpleNamespace(chunk_overlap=chunk_overlap, encoding=None))
+  return LegalRAGQueryEngine(rag_system)
+
+
+def _text(length, seed=0):
+  rng = np.random.RandomState(seed)
+  return "".join(rng.choice(list("abcdefghij "), length))
+
+
+def _result(document_id, chunk_index, content, relevance, start_char=None, total_chunks=3):
+  """Search result tối thiểu; token_count = số ký tự để dễ tính"""
+  metadata = {
+    'document_id': document_id,
+    'chunk_index': chunk_index,
+    'token_count': len(content),
+    'total_chunks': total_chunks
+  }
+  if start_char is not None:
+    metadata['start_char'] = start_char
+    metadata['end_char'] = start_char + len(content)
+
+  return {
+    'content': content,
+    'metadata': metadata,
+    'relevance_score': relevance,
+    'source_info': {'folder': "thue_gtgt", 'file': f"{document_id}.txt"}
+  }
+
+
+def _chunks(text, relevances, size=100, step=80, with_offsets=True):
+  """Cắt text thành chunks dài size, chunk sau bắt đầu cách chunk trước step ký tự (overlap = size - step)"""
+  return [
+    _result("doc1", i, text[i * step:i * step + size], relevance, i * step if with_offsets else None, len(relevances))
+    for i, relevance in enumerate(relevances)
+  ]
+
+
+def _keys(selected):
+  return sorted((c['document_id'], c['chunk_index']) for c in selected)
+
+
+def test_chunk_that_does_not_fit_is_skipped_for_a_later_one():
+  results = [
+    _result("big", 0, "x" * 80, 0.9),
+    _result("best", 0, "y" * 50, 0.8),
+    _result("small", 0, "z" * 30, 0.2)
+  ]
+
+  # Thứ tự relevance / token: best (50) -> big (80, vượt budget, bỏ qua) -> small (30)
+  selected, used_tokens = _engine()._pack_context_chunks(results, token_limit=100)
+
+  assert _keys(selected) == [("best", 0), ("small", 0)]
+  assert used_tokens == 80
+
+
+@pytest.mark.parametrize("order", list(itertools.permutations(range(3))))
+def test_overlap_is_deducted_once_in_any_selection_order(order):
+  text = _text(260)
+  relevances = [0.0] * 3
+  for rank, chunk_index in enumerate(order):
+    relevances[chunk_index] = 0.9 - rank * 0.1
+
+  selected, used_tokens = _engine()._pack_context_chunks(_chunks(text, relevances), token_limit=1000)
+
+  # 3 chunks x 100 ký tự, mỗi cặp liền kề overlap 20: chỉ tính 260 ký tự thực sự khác nhau
+  assert len(selected) == 3
+  assert used_tokens == len(text)
+
+
+def test_overlap_discount_lets_neighbor_fit_tight_budget():
+  text = _text(180)
+  results = _chunks(text, [0.9, 0.5])
+
+  # Chunk 1 chỉ tốn 80 tokens sau khi trừ overlap với chunk 0
+  selected, used_tokens = _engine()._pack_context_chunks(results, token_limit=180)
+
+  assert _keys(selected) == [("doc1", 0), ("doc1", 1)]
+  assert used_tokens == 180
+
+
+@pytest.mark.parametrize("with_offsets", [True, False])
+def test_merged_block_rebuilds_original_text(with_offsets):
+  text = _text(260)
+  engine = _engine()
+  selected, _ = engine._pack_context_chunks(_chunks(text, [0.3, 0.9, 0.6], with_offsets=with_offsets), 1000)
+
+  blocks = engine._merge_adjacent_chunks(selected)
+
+  # Không có offsets thì overlap được tìm lại từ nội dung
+  assert len(blocks) == 1
+  assert blocks[0]['text'] == text
+  assert blocks[0]['chunk_position'] == "1-3/3"
+  assert blocks[0]['source'] == "thue_gtgt/doc1.txt"
+  assert blocks[0]['relevance'] == 0.9
+
+
+def test_gap_splits_blocks_and_most_relevant_block_comes_first():
+  text = _text(420)
+  engine = _engine()
+  results = _chunks(text, [0.4, 0.0, 0.2, 0.9, 0.8])
+  selected = [
+    candidate for candidate in engine._pack_context_chunks(results, 1000)[0]
+    if candidate['chunk_index'] != 1
+  ]
+
+  blocks = engine._merge_adjacent_chunks(selected)
+
+  assert [block['chunk_position'] for block in blocks] == ["3-5/5", "1/5"]
+  assert blocks[0]['text'] == text[160:420]
+  assert blocks[1]['text'] == text[:100]
@@ -0,0 +1,130 @@
+import numpy as np
+from core.near_duplicates import DuplicateIndex, MinHasher, normalize_text
+
+
+def _text(count, seed=0, prefix="từ"):
+  rng = np.random.RandomState(seed)
+  return " ".join(f"{prefix}{i}" for i in rng.randint(0, 5000, count))
+
+
+def _edit(text, fraction, seed=1):
+  """Thay một phần words để tạo bản gần trùng"""
+  words = text.split()
+  rng = np.random.RandomState(seed)
+  for position in rng.choice(len(words), int(len(words) * fraction), replace=False):
+    words[position] = f"khác{position}"
+  return " ".join(words)
+
+
+def _register_chunk(index, chunk_id, text):
+  canonical, fingerprint = index.find_duplicate_chunk(text)
+  assert canonical is None
+  index.register_chunk(chunk_id, fingerprint)
+
+
+def test_signature_is_deterministic_and_independent_of_block_size():
+  tokens = normalize_text(_text(3000))
+
+  signature = MinHasher().signature(tokens)
+  assert signature.shape == (64,)
+  np.testing.assert_array_equal(signature, MinHasher().signature(tokens))
+  np.testing.assert_array_equal(signature, MinHasher(block_size=7).signature(tokens))
+  assert MinHasher().signature([]).shape == (64,)
+
+
+def test_exact_duplicate_ignores_case_and_punctuation(tmp_path):
+  index = DuplicateIndex(str(tmp_path / "duplicates.json"))
+  text = _text(200)
+  _register_chunk(index, "docA_chunk_0", text)
+
+  canonical, _ = index.find_duplicate_chunk(text.upper().replace(" ", ", "))
+  assert canonical == "docA_chunk_0"
+
+
+def test_near_duplicate_is_similar_but_never_aliased(tmp_path):
+  index = DuplicateIndex(str(tmp_path / "duplicates.json"))
+  text = _text(400)
+  _register_chunk(index, "docA_chunk_0", text)
+
+  # 2 words khác (~10 shingles) -> Jaccard ~0.95: gần trùng nhưng nội dung khác, không được alias
+  canonical, fingerprint = index.find_duplicate_chunk(_edit(text, 0.005))
+  assert canonical is None
+  assert index.find_similar_chunk(fingerprint) == "docA_chunk_0"
+
+  # 20% words khác -> Jaccard shingles thấp, không được coi là gần trùng
+  assert index.find_similar_chunk(index.find_duplicate_chunk(_edit(text, 0.2))[1]) is None
+
+  # Nội dung khác hẳn
+  assert index.find_similar_chunk(index.find_duplicate_chunk(_text(400, seed=5, prefix="chữ"))[1]) is None
+
+
+def test_amended_provision_is_not_a_duplicate(tmp_path):
+  index = DuplicateIndex(str(tmp_path / "duplicates.json"))
+  original = (
+    "Điều 11. Thuế suất 10% áp dụng đối với hàng hóa, dịch vụ không quy định tại Điều 9 và Điều 10 "
+    "của Luật này, bao gồm cả hàng hóa, dịch vụ nhập khẩu và dịch vụ cung cấp trong nước. "
+  ) * 4
+  _register_chunk(index, "docA_chunk_0", original)
+  index.register_document("docA", index.find_duplicate_document(original)[1])
+
+  amended = original.replace("Thuế suất 10%", "Thuế suất 8%")
+  assert index.find_duplicate_chunk(amended)[0] is None
+  assert index.find_duplicate_document(amended)[0] is None
+
+  _register_chunk(index, "docB_chunk_0", amended)
+  assert not index.same_content("docA_chunk_0", "docB_chunk_0")
+
+
+def test_alias_documents_and_similarity(tmp_path):
+  index = DuplicateIndex(str(tmp_path / "duplicates.json"))
+  text = _text(200)
+  _register_chunk(index, "docA_chunk_0", text)
+  _register_chunk(index, "docA_chunk_1", _text(200, seed=3))
+  index.add_chunk_alias("docB_chunk_4", "docA_chunk_0")
+  index.add_document_alias("docC", "docA")
+
+  assert index.alias_documents("docA_chunk_0") == ["docC", "docB"]
+  assert index.alias_documents("docA_chunk_1") == ["docC"]
+  assert index.similarity("docA_chunk_0", "docA_chunk_0") == 1.0
+  assert index.same_content("docA_chunk_0", "docA_chunk_0")
+  assert not index.same_content("docA_chunk_0", "docA_chunk_1")
+  assert index.similarity("docA_chunk_0", "docA_chunk_1") < 0.5
+  assert index.similarity("docA_chunk_0", "missing") == 0.0
+
+
+def test_remove_document_returns_orphans(tmp_path):
+  index = DuplicateIndex(str(tmp_path / "duplicates.json"))
+  text = _text(200)
+  _register_chunk(index, "docA_chunk_0", text)
+  canonical, document_fingerprint = index.find_duplicate_document(text)
+  index.register_document("docA", document_fingerprint)
+
+  index.add_chunk_alias("docB_chunk_0", "docA_chunk_0")
+  index.add_document_alias("docC", "docA")
+
+  assert index.remove_document("docA") == ["docB", "docC"]
+
+  # Bản canonical không còn: không còn alias trỏ vào, text đó được coi là mới
+  assert index.chunk_aliases == {}
+  assert index.document_aliases == {}
+  assert index.find_duplicate_chunk(text)[0] is None
+  assert index.find_duplicate_document(text)[0] is None
+  assert index.alias_documents("docA_chunk_0") == []
+
+
+def test_save_and_load_roundtrip(tmp_path):
+  path = str(tmp_path / "duplicates.json")
+  index = DuplicateIndex(path)
+  text = _text(200)
+  _register_chunk(index, "docA_chunk_0", text)
+  index.add_chunk_alias("docB_chunk_0", "docA_chunk_0")
+  index.link_folders("folderB", "folderA")
+  index.save()
+
+  loaded = DuplicateIndex(path)
+  assert loaded.load()
+  assert loaded.find_duplicate_chunk(text)[0] == "docA_chunk_0"
+  assert loaded.find_similar_chunk(loaded.find_duplicate_chunk(_edit(text, 0.005))[1]) == "docA_chunk_0"
+  assert loaded.alias_documents("docA_chunk_0") == ["docB"]
+  assert loaded.folder_links == {"folderB": ["folderA"]}
+  assert not DuplicateIndex(str(tmp_path / "missing.json")).load()
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from core.related_document_graph import RelatedDocumentGraph
+
+
+def _vectors(count, dimension=16, seed=0):
+  return np.random.RandomState(seed).randn(count, dimension).astype(np.float32)
+
+
+def _assert_same_graph(graph, expected):
+  assert set(graph.neighbors) == set(expected.neighbors)
+  for document_id, related in expected.neighbors.items():
+    assert [doc_id for doc_id, _ in graph.neighbors[document_id]] == [doc_id for doc_id, _ in related]
+    np.testing.assert_allclose(
+      [score for _, score in graph.neighbors[document_id]],
+      [score for _, score in related],
+      rtol=1e-5, atol=1e-6
+    )
+
+
+def _full_build(tmp_path, document_ids, vectors, top_k):
+  graph = RelatedDocumentGraph(str(tmp_path / "full.json"), top_k=top_k)
+  graph.build(document_ids, vectors)
+  return graph
+
+
+def test_build_returns_sorted_top_k_without_self():
+  document_ids = [f"doc{i}" for i in range(20)]
+  graph = RelatedDocumentGraph("unused.json", top_k=5, block_size=7)
+  graph.build(document_ids, _vectors(20))
+
+  for document_id, related in graph.neighbors.items():
+    assert len(related) == 5
+    assert document_id not in [doc_id for doc_id, _ in related]
+    scores = [score for _, score in related]
+    assert scores == sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize("block_size", [3, 256])
+def test_incremental_update_matches_full_build(tmp_path, block_size):
+  document_ids = [f"doc{i}" for i in range(30)]
+  vectors = _vectors(30)
+
+  graph = RelatedDocumentGraph(str(tmp_path / "graph.json"), top_k=4, block_size=block_size)
+  graph.build(document_ids, vectors)
+
+  # Sửa 3 documents, xóa 2, thêm 2
+  vectors = vectors.copy()
+  changed = ["doc1", "doc7", "doc12"]
+  vectors[[document_ids.index(document_id) for document_id in changed]] = _vectors(len(changed), seed=2)
+  removed = ["doc3", "doc20"]
+  keep = [i for i, document_id in enumerate(document_ids) if document_id not in removed]
+  new_ids = [document_ids[i] for i in keep] + ["doc30", "doc31"]
+  new_vectors = np.vstack([vectors[keep], _vectors(2, seed=1)])
+
+  graph.update(new_ids, new_vectors, changed_ids=changed + ["doc30", "doc31"], removed_ids=removed)
+
+  _assert_same_graph(graph, _full_build(tmp_path, new_ids, new_vectors, top_k=4))
+
+
+def test_update_recomputes_rows_pointing_to_removed_documents(tmp_path):
+  document_ids = [f"doc{i}" for i in range(10)]
+  vectors = _vectors(10)
+
+  graph = RelatedDocumentGraph(str(tmp_path / "graph.json"), top_k=3)
+  graph.build(document_ids, vectors)
+
+  graph.update(document_ids[1:], vectors[1:], removed_ids=["doc0"])
+
+  for related in graph.neighbors.values():
+    assert "doc0" not in [doc_id for doc_id, _ in related]
+  _assert_same_graph(graph, _full_build(tmp_path, document_ids[1:], vectors[1:], top_k=3))
+
+
+def test_save_and_load_roundtrip(tmp_path):
+  path = str(tmp_path / "graph.json")
+  graph = RelatedDocumentGraph(path, top_k=3)
+  graph.build([f"doc{i}" for i in range(6)], _vectors(6))
+  graph.save()
+
+  loaded = RelatedDocumentGraph(path, top_k=3)
+  assert loaded.load()
+  _assert_same_graph(loaded, graph)
+  assert not RelatedDocumentGraph(str(tmp_path / "missing.json")).load()